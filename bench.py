@@ -0,0 +1,327 @@
+# bench.py
+#
+# Microbenchmarks for the hot paths, e.g.
+#   python bench.py --update-baseline            # record bench_baseline.json on the reference machine
+#   python bench.py --json results.json           # later: compare against it, exit 1 on a regression
+#   python bench.py server --threshold 0.2        # only benchmarks whose name contains "server"
+#
+# Every benchmark calls the real code: the training env, the client's ball
+# and collision update, one server tick over many matches, state encoding
+# and parsing, and policy prediction. Benchmarks whose dependencies are not
+# installed (gym, pygame, stable_baselines3) are reported as skipped.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DEFAULT_BASELINE = "bench_baseline.json"
+SERVER_MATCH_COUNTS = (1, 100, 1000)
+PREDICT_BATCH = 64
+
+SAMPLE_STATE = ("PADDLE1_Y:250:PADDLE2_Y:310:BALL_X:512.5:BALL_Y:287.25:BALL_VEL_X:-5.0:"
+                "BALL_VEL_Y:3.75:SCORE1:4:SCORE2:7:TICK:12345:ACK1:12343:ACK2:12340")
+
+
+class Skip(Exception):
+    pass
+
+
+def run_loops(fn, loops, prepare):
+    """Seconds spent in loops calls of fn, not counting prepare() before each of them."""
+    if prepare is None:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        return time.perf_counter() - start
+    elapsed = 0.0
+    for _ in range(loops):
+        prepare()
+        start = time.perf_counter()
+        fn()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+def time_it(fn, repeats, min_time, prepare=None):
+    """Median and best time per call in microseconds, after sizing the loop to take min_time."""
+    loops = 1
+    while True:
+        elapsed = run_loops(fn, loops, prepare)
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / elapsed * 1.1)) if elapsed > 0 else loops * 10
+
+    samples = [run_loops(fn, loops, prepare) / loops * 1e6 for _ in range(repeats)]
+    return {"median_us": statistics.median(samples), "min_us": min(samples), "loops": loops, "repeats": repeats}
+
+
+# Each setup function returns the function to time, or a (prepare, fn) pair whose
+# prepare() runs untimed before every call, or raises Skip. Anything a setup leaves
+# behind is undone by the functions it adds to cleanups, run in reverse once its
+# benchmark is done.
+cleanups = []
+
+def setup_env_step():
+    try:
+        from custom_pong_env import CustomPongEnv
+    except ImportError as e:
+        raise Skip(e)
+    env = CustomPongEnv()
+    actions = itertools.cycle(np.random.default_rng(0).integers(0, 3, 4096).tolist())
+
+    def step():
+        _obs, _reward, done, _info = env.step(next(actions))
+        if done:
+            env.reset()
+    return step
+
+def setup_env_reset():
+    try:
+        from custom_pong_env import CustomPongEnv
+    except ImportError as e:
+        raise Skip(e)
+    return CustomPongEnv().reset
+
+def import_client():
+    # The client opens a window and loads its assets on import
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    try:
+        import pong_client
+    except ImportError as e:
+        raise Skip(e)
+    pong_client.hit_sound = None
+    return pong_client
+
+def setup_client_ball_update():
+    client = import_client()
+    ball = client.Ball(client.WIDTH // 2, client.HEIGHT // 2)
+
+    def update():
+        ball.update()
+        if not 0 <= ball.x <= client.WIDTH:
+            ball.x = client.WIDTH // 2
+    return update
+
+def setup_client_update_ball():
+    client = import_client()
+    ball = client.Ball(client.WIDTH // 2, client.HEIGHT // 2)
+    paddle1 = client.Paddle(20)
+    paddle2 = client.Paddle(client.WIDTH - client.PADDLE_WIDTH - 20)
+
+    def update():
+        # Keep the paddles on the ball so collisions are exercised, not just misses
+        paddle1.rect.centery = paddle2.rect.centery = int(ball.y)
+        client.update_ball(ball, paddle1, paddle2, 0, 0)
+    return update
+
+def setup_client_parse():
+    client = import_client()
+    return lambda: client.parse_game_state(SAMPLE_STATE)
+
+
+class NullWriter:
+    """Stands in for a client's StreamWriter: counts what would be sent."""
+
+    class Transport:
+        def get_write_buffer_size(self):
+            return 0
+
+    def __init__(self):
+        self.transport = self.Transport()
+        self.sent = 0
+
+    def write(self, data):
+        self.sent += len(data)
+
+    def is_closing(self):
+        return False
+
+
+def server_matches(count):
+    """Fills the server's globals with count running matches between NullWriters."""
+    import pong_server
+    from event_log import EventLog
+    from match_store import MatchStore
+
+    events_dir = tempfile.mkdtemp(prefix="bench_events_")
+    pong_server.events = EventLog(events_dir)
+    # Run last first: stop the writer thread, then remove its directory
+    cleanups.append(lambda: shutil.rmtree(events_dir, ignore_errors=True))
+    cleanups.append(pong_server.events.close)
+    pong_server.store = MatchStore(seed=0, input_depth=0)
+    pong_server.matches = {}
+    for _ in range(count):
+        game_state = pong_server.new_game_state({1: "a", 2: "b"})
+        for player_id in (1, 2):
+            pong_server.join_match(game_state, player_id, NullWriter())
+        pong_server.matches[game_state["slot"]] = game_state
+    return pong_server
+
+def setup_server_tick(count):
+    def setup():
+        server = server_matches(count)
+        store = server.store
+        slots = np.array(sorted(server.matches))
+        seq = itertools.count(1)
+        n = 0
+
+        def arrive():
+            # Inputs arrive every tick as they would from clients. Nobody ever wins,
+            # so the match count stays fixed
+            nonlocal n
+            n = next(seq)
+            for game_state in server.matches.values():
+                for player_id in game_state["players"]:
+                    server.push_input(game_state, player_id, n, n - 1, (n // 20) % 3 - 1)
+            store.score[slots] = 0
+
+        return arrive, lambda: server.run_tick(store, n)
+    return setup
+
+def setup_server_encode():
+    import pong_server
+    values = (250, 310, 512.5, 287.25, -5.0, 3.75, 4, 7, 12345, 12343, 12340)
+    return lambda: pong_server.encode_game_state(*values)
+
+def setup_server_broadcast():
+    server = server_matches(1000)
+    store = server.store
+    slots = np.array(sorted(server.matches))
+
+    def broadcast():
+        store.tick[slots] += 1  # so every player is due an update
+        server.broadcast_game_state(store, slots)
+    return broadcast
+
+def load_policy():
+    from policy_registry import load_ppo
+    try:
+        with open("trained_model.zip", "rb") as f:
+            return load_ppo(f.read())
+    except (ImportError, FileNotFoundError) as e:
+        raise Skip(e)
+
+def setup_predict_single():
+    model = load_policy()
+    obs = np.array([[512.5, 287.25, 0, 0]])  # what the client's trained_ai_observation builds
+    return lambda: model.predict(obs, deterministic=True)
+
+def setup_predict_batch():
+    model = load_policy()
+    obs = np.random.default_rng(0).uniform(0, 600, (PREDICT_BATCH, 4)).astype(np.float32)
+    return lambda: model.predict(obs, deterministic=True)
+
+
+BENCHMARKS = {
+    "env_step": setup_env_step,
+    "env_reset": setup_env_reset,
+    "client_ball_update": setup_client_ball_update,
+    "client_update_ball": setup_client_update_ball,
+    "client_parse_state": setup_client_parse,
+    "server_encode_state": setup_server_encode,
+    "server_broadcast_1000": setup_server_broadcast,
+    **{f"server_tick_{count}": setup_server_tick(count) for count in SERVER_MATCH_COUNTS},
+    "predict_single": setup_predict_single,
+    f"predict_batch_{PREDICT_BATCH}": setup_predict_batch,
+}
+
+
+def baseline_median(baseline, name):
+    """The baseline's median for name, or None if it wasn't run (or was skipped) there."""
+    before = baseline.get("results", {}).get(name) or {}
+    return before.get("median_us")
+
+def compare(results, baseline, threshold):
+    """Benchmarks whose median is more than threshold slower than the baseline's."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline_median(baseline, name)
+        if before is None or "median_us" not in result:
+            continue
+        change = result["median_us"] / before - 1
+        result["baseline_us"] = before
+        result["change"] = change
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the game's hot paths and compare with a baseline.")
+    parser.add_argument("filter", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="flag benchmarks this much slower than the baseline (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    # Run from the repo so models and fonts are found
+    args.baseline = os.path.abspath(args.baseline)
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+
+    baseline = {}
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter and not any(pattern in name for pattern in args.filter):
+            continue
+        try:
+            benchmark = setup()
+            prepare, fn = benchmark if isinstance(benchmark, tuple) else (None, benchmark)
+            results[name] = time_it(fn, args.repeats, args.min_time, prepare)
+        except Skip as e:
+            results[name] = {"skipped": str(e)}
+            print(f"{name:24} skipped ({e})")
+            continue
+        finally:
+            while cleanups:
+                cleanups.pop()()
+        print(f"{name:24} {results[name]['median_us']:12.2f} us", end="")
+        before = baseline_median(baseline, name)
+        print(f"  ({results[name]['median_us'] / before - 1:+.1%})" if before else "")
+
+    regressions = compare(results, baseline, args.threshold)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "regressions": regressions,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline at {args.baseline}, run with --update-baseline to record one")
+
+    if regressions:
+        print(f"REGRESSION: {', '.join(regressions)} more than {args.threshold:.0%} slower than the baseline")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+
+class EventLog:
+    """Append-only JSON-lines event log written in batches by a background thread.
+
+    log() only appends to an in-memory batch, so callers on the event loop
+    never touch the disk. The writer thread flushes every flush_interval
+    seconds, or sooner once batch_size events are waiting, and rotates the
+    file into a gzip archive once it grows past max_bytes.
+    """
+
+    def __init__(self, directory="logs", name="events", flush_interval=1.0, batch_size=1000,
+                 max_bytes=16 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.writer = threading.Thread(target=self.run, name="event-log", daemon=True)
+        self.writer.start()
+
+    def log(self, event, **fields):
+        record = {"ts": time.time(), "event": event, **fields}
+        with self.lock:
+            self.pending.append(record)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.wake.set()
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush_safely()
+        self.flush_safely()
+        self.file.close()
+
+    def flush_safely(self):
+        """Flushes, reporting a failed batch instead of letting it stop the writer thread."""
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Event log: write failed: {e}")
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+            except (TypeError, ValueError) as e:
+                print(f"Event log: dropped unwritable {record.get('event')!r} event: {e}")
+        self.file.write("".join(lines))
+        self.file.flush()
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """Moves the live file aside as a gzip archive and starts a new one."""
+        self.file.close()
+        rotated = os.path.join(self.directory, f"{self.name}-{time.time_ns()}.jsonl")
+        os.replace(self.path, rotated)
+        self.file = open(self.path, "a", encoding="utf-8")
+        # Readers only ever see a complete archive: compress under a temporary name, then rename
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(rotated + ".gz.tmp", rotated + ".gz")
+        os.remove(rotated)
+
+    def close(self):
+        """Writes whatever is still pending and stops the writer thread."""
+        self.closed = True
+        self.wake.set()
+        self.writer.join()
+
+
+def rotated_chunks(directory, name):
+    """Rotated-out files by rotation time, whether or not their gzip archive is written yet."""
+    chunks = {}
+    for path in glob.glob(os.path.join(directory, f"{name}-*.jsonl*")):
+        stamp, _, suffix = os.path.basename(path)[len(name) + 1:].partition(".")
+        if stamp.isdigit() and suffix in ("jsonl", "jsonl.gz"):
+            chunks[int(stamp)] = os.path.join(directory, f"{name}-{stamp}.jsonl")
+    return chunks
+
+def read_chunk(raw_path):
+    # The archive if it's there, else the raw file it's being compressed from. The raw file
+    # is only removed once the archive is in place, so one of the three opens succeeds.
+    for path in (raw_path + ".gz", raw_path, raw_path + ".gz"):
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            f = opener(path, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                yield json.loads(line)
+        return
+
+def read_events(directory="logs", name="events", follow=False, poll_interval=1.0):
+    """Yields logged events oldest first: the gzip archives, then the live file.
+
+    With follow=True this keeps tailing the live file, carrying on into the
+    new file whenever the writer rotates it.
+    """
+    path = os.path.join(directory, f"{name}.jsonl")
+    done = set()  # rotation stamps of chunks already read
+    f = None
+    while True:
+        if f is None:
+            for stamp, raw_path in sorted(rotated_chunks(directory, name).items()):
+                if stamp not in done:
+                    yield from read_chunk(raw_path)
+                    done.add(stamp)
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                if not follow:
+                    return
+                time.sleep(poll_interval)
+                continue
+            if rotated_chunks(directory, name).keys() - done:
+                # Rotated between the glob and the open; catch up on that chunk first
+                f.close()
+                f = None
+                continue
+
+        position = f.tell()
+        line = f.readline()
+        if line.endswith(b"\n"):
+            yield json.loads(line)
+            continue
+        f.seek(position)  # leave a half-written line for the next pass
+        if not follow:
+            break
+        try:
+            rotated = os.stat(path).st_ino != os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = False
+        if rotated:
+            # The writer is done with the old file; finish it, then move on to the new one
+            for line in f:
+                yield json.loads(line)
+            f.close()
+            f = None
+            # That file is the oldest chunk rotated out since it was opened. Any newer
+            # ones went by while we were reading and are picked up from their archives.
+            unread = rotated_chunks(directory, name).keys() - done
+            if unread:
+                done.add(min(unread))
+            continue
+        time.sleep(poll_interval)
+    f.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream logged match events as JSON lines.")
+    parser.add_argument("directory", nargs="?", default="logs")
+    parser.add_argument("--name", default="events")
+    parser.add_argument("--follow", action="store_true", help="keep waiting for new events")
+    args = parser.parse_args()
+    try:
+        for event in read_events(args.directory, args.name, follow=args.follow):
+            sys.stdout.write(json.dumps(event) + "\n")
+            sys.stdout.flush()
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
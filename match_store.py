@@ -0,0 +1,244 @@
+import numpy as np
+
+WIDTH, HEIGHT = 1000, 600
+BALL_RADIUS = 10
+PADDLE_WIDTH, PADDLE_HEIGHT = 10, 100
+PADDLE_SPEED = 6  # same as the client's Paddle.speed so prediction matches
+PADDLE_X = np.array([20, WIDTH - PADDLE_WIDTH - 20])
+MAX_BALL_SPEED = 10
+MAX_REWIND_TICKS = 30  # how far back (500 ms at 60 ticks/s) a hit can be judged
+
+# Client inputs: one per client frame, applied one per server tick
+JITTER_BUFFER_TICKS = 3  # inputs held back before a player's stream starts
+MAX_BUFFERED_INPUTS = 30  # drop the oldest inputs if a client runs this far ahead
+
+# name -> (per-slot shape, dtype, value of a fresh slot)
+FIELDS = {
+    "in_use": ((), bool, False),
+    "running": ((), bool, False),
+    "tick": ((), np.int64, 0),
+    "paddle_y": ((2,), np.int64, HEIGHT // 2 - PADDLE_HEIGHT // 2),
+    "ball_x": ((), np.float64, WIDTH // 2),
+    "ball_y": ((), np.float64, HEIGHT // 2),
+    "vel_x": ((), np.float64, 5),
+    "vel_y": ((), np.float64, 5),
+    "score": ((2,), np.int64, 0),
+    "out_tick": ((), np.int64, -1),  # tick the ball left the court, -1 while in play
+    "moves": ((2,), np.int64, 0),  # this tick's input per player: -1 up, 0 idle, 1 down
+    "view_tick": ((2,), np.int64, 0),  # server tick each player said they were looking at for that input
+    "seen_tick": ((2,), np.int64, 0),  # the same, limited to what the player's lag can explain
+    "history": ((MAX_REWIND_TICKS + 1, 4), np.float64, 0),  # ring of (x, y, vel_x, vel_y) by tick
+    "history_start": ((), np.int64, 1),  # oldest tick in history that belongs to the current rally
+    # Each player's jitter buffer: a ring of (seq, view tick, move) in arrival order
+    "input_seq": ((2, MAX_BUFFERED_INPUTS), np.int64, 0),
+    "input_view": ((2, MAX_BUFFERED_INPUTS), np.int64, 0),
+    "input_move": ((2, MAX_BUFFERED_INPUTS), np.int64, 0),
+    "input_head": ((2,), np.int64, 0),
+    "input_count": ((2,), np.int64, 0),
+    "last_seq": ((2,), np.int64, 0),  # newest seq buffered
+    "latest_view": ((2,), np.int64, 0),  # newest view tick a player has claimed
+    "next_seq": ((2,), np.int64, -1),  # seq to play next, -1 until the player's stream starts
+    "ack": ((2,), np.int64, 0),  # last seq played
+    # Players' connections
+    "connected": ((2,), bool, False),
+    "started": ((), bool, False),  # both players have been connected at once
+    "rewind_ticks": ((2,), np.int64, 0),  # furthest back a player's view can honestly be
+    "update_interval": ((2,), np.int64, 1),  # ticks between state updates to a player
+    "last_sent_tick": ((2,), np.int64, -1_000_000),  # tick of the last update sent to a player
+}
+
+
+class MatchStore:
+    """Ball, paddle, score and player input state of every match, one row per match slot.
+
+    Each field is a preallocated array that doubles when the slots run out.
+    Inputs are buffered into the arrays as they arrive, and once a tick
+    pop_inputs() and step() advance every running match at once with array
+    operations.
+    """
+
+    def __init__(self, capacity=64, seed=None, input_depth=JITTER_BUFFER_TICKS):
+        self.rng = np.random.default_rng(seed)
+        self.input_depth = input_depth
+        self.capacity = 0
+        self.free = []
+        for name, (shape, dtype, fill) in FIELDS.items():
+            setattr(self, name, np.full((0,) + shape, fill, dtype=dtype))
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        for name, (shape, dtype, fill) in FIELDS.items():
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            array[:self.capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def allocate(self):
+        """Claims a slot for a new match and resets it to the kick-off state."""
+        if not self.free:
+            self.grow(max(self.capacity * 2, 16))
+        slot = self.free.pop()
+        for name, (shape, dtype, fill) in FIELDS.items():
+            getattr(self, name)[slot] = fill
+        self.in_use[slot] = True
+        return slot
+
+    def release(self, slot):
+        self.in_use[slot] = False
+        self.running[slot] = False
+        self.free.append(slot)
+
+    def push_input(self, slot, side, seq, view_tick, move):
+        """Buffers one of a player's inputs, the server tick they were looking at and their move.
+
+        Inputs arrive in order, so anything not newer than the last one buffered
+        is a repeat, and anything older than the next to play arrived too late.
+        """
+        if seq <= self.last_seq[slot, side] or seq < self.next_seq[slot, side]:
+            return
+        # A client's view only moves forward and can't be ahead of the server
+        view_tick = min(max(view_tick, self.latest_view[slot, side]), self.tick[slot])
+        self.latest_view[slot, side] = view_tick
+        self.last_seq[slot, side] = seq
+        head, count = self.input_head[slot, side], self.input_count[slot, side]
+        if count == MAX_BUFFERED_INPUTS:
+            head = self.input_head[slot, side] = (head + 1) % MAX_BUFFERED_INPUTS
+            count -= 1
+        pos = (head + count) % MAX_BUFFERED_INPUTS
+        self.input_seq[slot, side, pos] = seq
+        self.input_view[slot, side, pos] = view_tick
+        self.input_move[slot, side, pos] = move
+        self.input_count[slot, side] = count + 1
+
+    def pop_inputs(self, idx):
+        """Takes the next buffered input of both players of the slots in idx into moves and view_tick.
+
+        A player's stream starts once input_depth inputs are buffered. A late
+        input keeps its place: it is only used up once it is played, and
+        until then the player's last move is repeated, so a client running
+        slightly slower than the tick rate or pausing loses nothing. A gap in
+        the sequence was skipped by the client. A backlog from a client
+        running faster is trimmed back to the buffer depth so it can't build
+        up latency.
+        """
+        count = self.input_count[idx]
+        head = self.input_head[idx]
+        waiting = self.next_seq[idx] < 0
+        popping = (count > 0) & (~waiting | (count >= self.input_depth))
+
+        backlog = popping & (count > 2 * self.input_depth + 1)
+        drop = np.where(backlog, count - self.input_depth - 1, 0)
+        head = (head + drop) % MAX_BUFFERED_INPUTS
+        count -= drop
+
+        rows, sides = np.nonzero(popping)
+        slots, pos = idx[rows], head[rows, sides]
+        seq = self.input_seq[slots, sides, pos]
+        self.moves[slots, sides] = self.input_move[slots, sides, pos]
+        self.view_tick[slots, sides] = self.input_view[slots, sides, pos]
+        self.ack[slots, sides] = seq
+        self.next_seq[slots, sides] = seq + 1
+        head[rows, sides] = (pos + 1) % MAX_BUFFERED_INPUTS
+        count[rows, sides] -= 1
+        self.input_head[idx] = head
+        self.input_count[idx] = count
+
+    def step(self):
+        """Advances every running match one tick.
+
+        Returns the slots that scored this tick and the scoring player (1 or 2) for each.
+        """
+        idx = np.flatnonzero(self.running)
+        if idx.size == 0:
+            return idx, idx
+        n = idx.size
+        self.tick[idx] += 1
+        tick = self.tick[idx]
+
+        # Inputs move the paddles; the server owns their positions
+        paddle_y = np.clip(self.paddle_y[idx] + self.moves[idx] * PADDLE_SPEED, 0, HEIGHT - PADDLE_HEIGHT)
+        self.paddle_y[idx] = paddle_y
+
+        x = self.ball_x[idx] + self.vel_x[idx]
+        y = self.ball_y[idx] + self.vel_y[idx]
+        vel_x = self.vel_x[idx]
+        vel_y = self.vel_y[idx]
+        out_tick = self.out_tick[idx]
+        history_start = self.history_start[idx]
+        seen_tick = self.seen_tick[idx]
+
+        # Ball collision with top/bottom walls
+        wall = (y <= BALL_RADIUS) | (y >= HEIGHT - BALL_RADIUS)
+        vel_y[wall] *= -1
+
+        # Ball collision with paddles, either live or as the player saw it
+        rewound = []
+        for side in (0, 1):
+            toward = vel_x < 0 if side == 0 else vel_x > 0
+            live = toward & self.overlaps(x, y, side, paddle_y[:, side])
+            if live.any():
+                vel_x[live] = np.abs(vel_x[live]) if side == 0 else -np.abs(vel_x[live])
+                vel_y[live] += self.rng.uniform(-2, 2, live.sum())
+                out_tick[live] = -1
+
+            seen = seen_tick[:, side]
+            candidates = toward & ~live & (seen < tick) & (tick - seen <= MAX_REWIND_TICKS) & (seen >= history_start)
+            if candidates.any():
+                rows = np.flatnonzero(candidates)
+                past = self.history[idx[rows], seen[rows] % (MAX_REWIND_TICKS + 1)]
+                past_toward = past[:, 2] < 0 if side == 0 else past[:, 2] > 0
+                hit = past_toward & self.overlaps(past[:, 0], past[:, 1], side, paddle_y[rows, side])
+                rewound.extend((row, side, past_row) for row, past_row in zip(rows[hit], past[hit]))
+
+        # Rewound hits are rare, so replaying them one match at a time is fine
+        for row, side, past_row in rewound:
+            slot = idx[row]
+            bx, by, bvx, bvy = past_row
+            bvx = abs(bvx) if side == 0 else -abs(bvx)
+            bvy += self.rng.uniform(-2, 2)
+            for t in range(int(seen_tick[row, side]), int(tick[row])):
+                self.history[slot, t % (MAX_REWIND_TICKS + 1)] = (bx, by, bvx, bvy)
+                bx += bvx
+                by += bvy
+                if by <= BALL_RADIUS or by >= HEIGHT - BALL_RADIUS:
+                    bvy *= -1
+            x[row], y[row], vel_x[row], vel_y[row] = bx, by, bvx, bvy
+            out_tick[row] = -1
+
+        # Scoring waits until the defending player has seen the ball leave the court
+        out_left = x < 0
+        out = out_left | (x > WIDTH)
+        out_tick[out & (out_tick < 0)] = tick[out & (out_tick < 0)]
+        defender = np.where(out_left, 0, 1)
+        defender_seen = seen_tick[np.arange(n), defender]
+        award = out & ((defender_seen >= out_tick) | (tick - out_tick >= MAX_REWIND_TICKS))
+        scorer = 1 - defender
+        if award.any():
+            self.score[idx[award], scorer[award]] += 1
+            x[award] = WIDTH // 2
+            y[award] = HEIGHT // 2
+            vel_x[award] = np.where(defender[award] == 0, np.abs(vel_x[award]), -np.abs(vel_x[award]))
+            vel_y[award] = self.rng.uniform(-5, 5, award.sum())
+            out_tick[award] = -1
+            history_start[award] = tick[award]
+
+        # Keep velocities within reasonable bounds
+        np.clip(vel_x, -MAX_BALL_SPEED, MAX_BALL_SPEED, out=vel_x)
+        np.clip(vel_y, -MAX_BALL_SPEED, MAX_BALL_SPEED, out=vel_y)
+
+        self.ball_x[idx] = x
+        self.ball_y[idx] = y
+        self.vel_x[idx] = vel_x
+        self.vel_y[idx] = vel_y
+        self.out_tick[idx] = out_tick
+        self.history_start[idx] = history_start
+        self.history[idx, tick % (MAX_REWIND_TICKS + 1)] = np.stack((x, y, vel_x, vel_y), axis=1)
+        return idx[award], scorer[award] + 1
+
+    @staticmethod
+    def overlaps(x, y, side, paddle_top):
+        """Ball/paddle rectangle overlap, the same test as pygame.Rect.colliderect."""
+        left = PADDLE_X[side]
+        return ((x - BALL_RADIUS < left + PADDLE_WIDTH) & (left < x + BALL_RADIUS)
+                & (y - BALL_RADIUS < paddle_top + PADDLE_HEIGHT) & (paddle_top < y + BALL_RADIUS))
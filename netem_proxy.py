@@ -0,0 +1,319 @@
+# netem_proxy.py
+#
+# Impairment proxy for testing online play on one machine:
+#   python pong_server.py
+#   python netem_proxy.py --profile mobile --report mobile.json
+#   PONG_SERVER_PORT=5556 python pong_client.py
+#
+# The game talks over TCP, which never loses or reorders data: a lost or
+# reordered packet shows up as a stall while the receiver waits for it, and
+# every line behind it is held back too. Impairments are applied per line
+# the same way: loss costs a retransmission timeout (doubling if the resend
+# is lost as well), reordering costs a short extra delay, and a line is
+# never delivered before the one sent ahead of it.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+PROFILES = {
+    "lan": [{"latency_ms": 1, "jitter_ms": 0.5}],
+    "wifi": [{"latency_ms": 15, "jitter_ms": 10, "loss": 0.01}],
+    "mobile": [{"latency_ms": 80, "jitter_ms": 30, "loss": 0.02, "reorder": 0.01, "bandwidth_kbps": 256}],
+    "congested": [
+        {"duration": 10, "latency_ms": 30, "jitter_ms": 5},
+        {"duration": 5, "latency_ms": 200, "jitter_ms": 80, "loss": 0.05, "bandwidth_kbps": 64},
+    ],
+    "flaky": [
+        {"duration": 20, "latency_ms": 40, "jitter_ms": 15, "loss": 0.01},
+        {"disconnect": True},
+    ],
+}
+
+PHASE_DEFAULTS = {
+    "duration": None,  # seconds, None means for the rest of the run
+    "latency_ms": 0,  # one way
+    "jitter_ms": 0,
+    "loss": 0.0,  # chance a line's packet is lost and has to be retransmitted
+    "rto_ms": 200,  # retransmission timeout, Linux's minimum
+    "reorder": 0.0,
+    "reorder_ms": 40,  # how long the receiver waits for a packet that arrives out of order
+    "bandwidth_kbps": None,
+    "disconnect": False,  # drop every connection when this phase starts
+}
+
+MAX_RETRANSMITS = 8  # a line lost more often than this goes through anyway
+STALL_MS = 100  # an update arriving this much later than the server spaced it is a visible stall
+TICK_MS = 1000 / 60  # the server's tick length
+
+
+def check_phase(number, phase):
+    """Raises ValueError unless phase is a dict of known settings with sensible values."""
+    if not isinstance(phase, dict):
+        raise ValueError(f"phase {number} must be an object of settings, got {phase!r}")
+    unknown = sorted(set(phase) - set(PHASE_DEFAULTS))
+    if unknown:
+        raise ValueError(f"phase {number} has unknown setting(s) {', '.join(unknown)}, "
+                         f"expected {', '.join(PHASE_DEFAULTS)}")
+    for key, value in phase.items():
+        if key == "disconnect":
+            valid = isinstance(value, bool)
+        elif value is None:
+            valid = PHASE_DEFAULTS[key] is None  # only settings that can be unlimited
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            valid = False
+        elif key in ("loss", "reorder"):
+            valid = 0 <= value <= 1
+        elif key in ("duration", "bandwidth_kbps"):
+            valid = value > 0
+        else:
+            valid = value >= 0
+        if not valid:
+            raise ValueError(f"phase {number} has an invalid {key}: {value!r}")
+
+
+class Profile:
+    """A scripted sequence of impairment phases, repeated once it runs out."""
+
+    def __init__(self, phases):
+        if not isinstance(phases, list) or not phases:
+            raise ValueError("a profile must be a non-empty list of phases")
+        for number, phase in enumerate(phases, 1):
+            check_phase(number, phase)
+        self.phases = [{**PHASE_DEFAULTS, **phase} for phase in phases]
+        self.index = 0
+        self.started = time.monotonic()
+
+    @property
+    def phase(self):
+        return self.phases[self.index]
+
+    def advance(self):
+        self.index = (self.index + 1) % len(self.phases)
+        self.started = time.monotonic()
+        return self.phase
+
+    def remaining(self):
+        duration = self.phase["duration"]
+        if duration is None:
+            return None
+        return max(0.0, duration - (time.monotonic() - self.started))
+
+
+class Observer:
+    """What a client behind the proxy sees of the server's state updates."""
+
+    def __init__(self, name):
+        self.name = name
+        self.delivered = 0
+        self.retransmitted = 0
+        self.staleness_ms = []
+        self.gaps_ms = []
+        self.stalls = 0
+        self.skipped_ticks = 0
+        self.last_delivery = None
+        self.last_tick = None
+
+    def on_delivery(self, line, received_at):
+        # Only state updates count; pings, the player ID and GAME_OVER are not updates
+        parts = line.split(b":")
+        if b"TICK" not in parts:
+            return
+        try:
+            tick = int(parts[parts.index(b"TICK") + 1])
+        except (IndexError, ValueError):
+            return
+
+        now = time.monotonic()
+        self.delivered += 1
+        self.staleness_ms.append((now - received_at) * 1000)
+        if self.last_delivery is not None:
+            gap = (now - self.last_delivery) * 1000
+            self.gaps_ms.append(gap)
+            # The server may send every few ticks on purpose; only lateness beyond that is a stall
+            if gap - (tick - self.last_tick) * TICK_MS >= STALL_MS:
+                self.stalls += 1
+            self.skipped_ticks += tick - self.last_tick - 1
+        self.last_delivery = now
+        self.last_tick = tick
+
+    def summary(self):
+        return {
+            "client": self.name,
+            "delivered": self.delivered,
+            "retransmitted": self.retransmitted,
+            "skipped_ticks": self.skipped_ticks,
+            "stalls": self.stalls,
+            "staleness_ms": percentiles(self.staleness_ms),
+            "update_gap_ms": percentiles(self.gaps_ms),
+        }
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": round(pick(0.5), 2), "p95": round(pick(0.95), 2), "p99": round(pick(0.99), 2),
+            "max": round(ordered[-1], 2)}
+
+
+class Link:
+    """One direction of a proxied connection."""
+
+    def __init__(self, profile, reader, writer, observer=None):
+        self.profile = profile
+        self.reader = reader
+        self.writer = writer
+        self.observer = observer
+        self.loop = asyncio.get_running_loop()
+        self.free_at = 0.0  # when the simulated wire finishes sending the previous line
+        self.last_delivery = 0.0
+
+    def schedule(self, line):
+        phase = self.profile.phase
+        now = self.loop.time()
+        departure = max(now, self.free_at)
+        if phase["bandwidth_kbps"]:
+            departure += len(line) * 8 / (phase["bandwidth_kbps"] * 1000)
+        self.free_at = departure
+
+        delay = max(0.0, phase["latency_ms"] + random.gauss(0, phase["jitter_ms"])) / 1000
+        rto = phase["rto_ms"] / 1000
+        for _ in range(MAX_RETRANSMITS):
+            if random.random() >= phase["loss"]:
+                break
+            delay += rto
+            rto *= 2
+            if self.observer is not None:
+                self.observer.retransmitted += 1
+        if random.random() < phase["reorder"]:
+            delay += phase["reorder_ms"] / 1000
+
+        # In order, like TCP: a late line holds back everything behind it. Timers due
+        # at the same moment can fire in any order, so keep delivery times strictly increasing.
+        delivery = max(departure + delay, self.last_delivery + 1e-6)
+        self.last_delivery = delivery
+        self.loop.call_at(delivery, self.deliver, line, time.monotonic())
+
+    def deliver(self, line, received_at):
+        if self.writer.is_closing():
+            return
+        self.writer.write(line)
+        if self.observer is not None:
+            self.observer.on_delivery(line, received_at)
+
+    async def pump(self):
+        try:
+            async for line in self.reader:
+                self.schedule(line)
+        except ConnectionError:
+            pass
+        # Close once everything already in flight has arrived
+        self.loop.call_at(max(self.last_delivery, self.loop.time()), self.writer.close)
+
+
+class Proxy:
+    def __init__(self, profile, upstream_host, upstream_port):
+        self.profile = profile
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.connections = set()
+        self.observers = []
+
+    async def handle(self, client_reader, client_writer):
+        addr = client_writer.get_extra_info('peername')
+        try:
+            server_reader, server_writer = await asyncio.open_connection(self.upstream_host, self.upstream_port)
+        except OSError as e:
+            print(f"Proxy: can't reach server: {e}")
+            client_writer.close()
+            return
+        print(f"Proxy: {addr} connected")
+        observer = Observer(f"{addr[0]}:{addr[1]}")
+        self.observers.append(observer)
+        writers = (client_writer, server_writer)
+        self.connections.add(writers)
+        try:
+            await asyncio.gather(
+                Link(self.profile, client_reader, server_writer).pump(),
+                Link(self.profile, server_reader, client_writer, observer).pump(),
+            )
+        finally:
+            self.connections.discard(writers)
+            print(f"Proxy: {addr} closed")
+
+    def disconnect_all(self):
+        print(f"Proxy: forcing {len(self.connections)} connection(s) closed")
+        for writers in list(self.connections):
+            for writer in writers:
+                writer.close()
+
+    async def run_profile(self):
+        while True:
+            remaining = self.profile.remaining()
+            if remaining is None:
+                return
+            await asyncio.sleep(remaining)
+            phase = self.profile.advance()
+            print(f"Proxy: phase {self.profile.index}: " +
+                  ", ".join(f"{k}={v}" for k, v in phase.items() if v != PHASE_DEFAULTS[k]))
+            if phase["disconnect"]:
+                self.disconnect_all()
+                if phase["duration"] is None:
+                    self.profile.advance()
+
+    def report(self):
+        return {"phases": self.profile.phases, "clients": [o.summary() for o in self.observers]}
+
+
+def load_profile(name):
+    if name in PROFILES:
+        return Profile(PROFILES[name])
+    with open(name) as f:
+        return Profile(json.load(f))
+
+
+async def main(args, profile):
+    host, port = args.upstream.rsplit(":", 1)
+    proxy = Proxy(profile, host, int(port))
+
+    server = await asyncio.start_server(proxy.handle, 'localhost', args.listen)
+    print(f"Proxy: {args.profile} on port {args.listen} -> {args.upstream}")
+    profile_task = asyncio.create_task(proxy.run_profile())
+    try:
+        async with server:
+            if args.duration:
+                await asyncio.sleep(args.duration)
+            else:
+                await server.serve_forever()
+    finally:
+        profile_task.cancel()
+        report = proxy.report()
+        print(json.dumps(report["clients"], indent=2))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proxy that adds latency, jitter, loss and disconnects.")
+    parser.add_argument("--profile", default="wifi",
+                        help=f"one of {', '.join(PROFILES)} or a JSON file with a list of phases")
+    parser.add_argument("--listen", type=int, default=5556)
+    parser.add_argument("--upstream", default="127.0.0.1:5555")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--report", help="write observed client stats to this JSON file")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    try:
+        profile = load_profile(args.profile)
+    except (OSError, ValueError) as e:
+        parser.error(f"can't use profile {args.profile}: {e}")
+    try:
+        asyncio.run(main(args, profile))
+    except KeyboardInterrupt:
+        pass
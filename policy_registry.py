@@ -0,0 +1,114 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+
+def load_ppo(data):
+    from stable_baselines3 import PPO
+    return PPO.load(io.BytesIO(data))
+
+def model_bytes(model):
+    """Memory held by a policy's parameters, used to keep the cache within budget."""
+    try:
+        return sum(p.numel() * p.element_size() for p in model.policy.parameters())
+    except AttributeError:
+        return 0
+
+
+class PolicyRegistry:
+    """Trained policies keyed by the hash of their file, one active policy per tier.
+
+    A watcher thread polls the tier files and loads changed ones in the
+    background, so game loops calling get() every tick never wait on disk
+    or on model loading; the new weights are simply picked up on the next tick.
+    """
+
+    def __init__(self, tiers, max_bytes=256 * 1024 * 1024, poll_interval=2.0, loader=load_ppo):
+        self.tiers = dict(tiers)  # tier -> path
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # content hash -> (model, size), least recently used first
+        self.active = {}  # tier -> content hash
+        self.signatures = {}  # path -> (mtime, size) last seen
+        self.watcher = None
+        self.stopped = threading.Event()
+
+    def get(self, tier):
+        """Returns the current policy for a tier, or None if none is loaded."""
+        with self.lock:
+            digest = self.active.get(tier)
+            if digest is None or digest not in self.cache:
+                return None
+            self.cache.move_to_end(digest)
+            return self.cache[digest][0]
+
+    def refresh(self):
+        """Loads any tier file that changed since the last check."""
+        for tier, path in self.tiers.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self.signatures.get(path) == signature:
+                continue
+            self.signatures[path] = signature
+            self.load_tier(tier, path)
+
+    def load_tier(self, tier, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self.lock:
+            if self.active.get(tier) == digest:
+                return
+            cached = digest in self.cache
+        if not cached:
+            try:
+                model = self.loader(data)
+            except Exception as e:
+                # Most likely the file is still being written, the next change retries it
+                print(f"Warning: could not load '{path}' for the {tier} tier: {e}")
+                return
+            with self.lock:
+                self.cache[digest] = (model, model_bytes(model))
+
+        with self.lock:
+            self.active[tier] = digest
+            self.cache.move_to_end(digest)
+            self.evict()
+        print(f"Loaded policy {digest[:12]} from '{path}' for the {tier} tier")
+
+    def evict(self):
+        """Drops least recently used policies over budget, never one a tier is using."""
+        in_use = set(self.active.values())
+        total = sum(size for _, size in self.cache.values())
+        for digest in list(self.cache):
+            if total <= self.max_bytes:
+                break
+            if digest in in_use:
+                continue
+            total -= self.cache.pop(digest)[1]
+
+    def watch(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"Warning: policy watcher failed: {e}")
+
+    def start(self):
+        """Loads every tier now, then keeps watching the files in a daemon thread."""
+        self.refresh()
+        if self.watcher is None:
+            self.watcher = threading.Thread(target=self.watch, name="policy-watcher", daemon=True)
+            self.watcher.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
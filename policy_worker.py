@@ -0,0 +1,102 @@
+import math
+import threading
+import time
+
+STAY = 2  # the policies' "don't move" action
+
+
+class PolicyWorker:
+    """Runs a policy on a background thread so the game loop never waits on predict().
+
+    The game loop hands over its newest observation with observe() and reads
+    the newest decision with action(). The worker decides decision_rate
+    times a second on whatever observation is newest at that moment, so
+    between decisions the last action is repeated, and a slow predict() call
+    only delays the AI's reaction, not the frame. A decision based on an
+    observation more than max_lag frames behind the newest one is stale and
+    the paddle holds still instead of acting on it. By default that is three
+    decisions' worth of frames, but never fewer than three frames, since
+    observations only arrive once a frame however fast the worker decides.
+    """
+
+    def __init__(self, get_model, decision_rate=20, frame_rate=60, max_lag=None, on_predict=None):
+        if not decision_rate > 0:
+            raise ValueError(f"decision_rate must be positive, got {decision_rate}")
+        if not frame_rate > 0:
+            raise ValueError(f"frame_rate must be positive, got {frame_rate}")
+        self.get_model = get_model  # called before every decision, so reloaded policies are picked up
+        self.on_predict = on_predict  # called on the worker thread with each predict()'s seconds
+        self.interval = 1 / decision_rate
+        self.max_lag = max_lag if max_lag is not None else max(3, math.ceil(3 * frame_rate / decision_rate))
+        self.lock = threading.Lock()
+        self.observation = None  # (obs, frame)
+        self.decision = None  # (action, frame it was decided on)
+        self.decisions = 0
+        self.stale = 0
+        self.predict_seconds = 0.0
+        self.worker = None
+        self.stopped = threading.Event()
+
+    def observe(self, obs, frame):
+        with self.lock:
+            self.observation = (obs, frame)
+
+    def action(self):
+        """The latest decided action, or STAY if there is none yet or it is stale."""
+        with self.lock:
+            decision = self.decision
+            observation = self.observation
+        if decision is None:
+            return STAY
+        action, frame = decision
+        if observation[1] - frame > self.max_lag:
+            self.stale += 1
+            return STAY
+        return action
+
+    def run(self):
+        next_decision = time.perf_counter()
+        decided_frame = None
+        while not self.stopped.wait(max(0.0, next_decision - time.perf_counter())):
+            # Never try to catch up on missed decisions, just carry on from now
+            next_decision = max(next_decision + self.interval, time.perf_counter())
+            with self.lock:
+                observation = self.observation
+            if observation is None or observation[1] == decided_frame:
+                continue
+            model = self.get_model()
+            if model is None:
+                continue
+            obs, frame = observation
+            start = time.perf_counter()
+            try:
+                action, _states = model.predict(obs, deterministic=True)
+            except Exception as e:
+                print(f"Warning: policy prediction failed: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            self.predict_seconds += elapsed
+            if self.on_predict is not None:
+                self.on_predict(elapsed)
+            self.decisions += 1
+            decided_frame = frame
+            with self.lock:
+                self.decision = (action, frame)
+
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run, name="policy-worker", daemon=True)
+            self.worker.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.worker is not None:
+            self.worker.join()
+
+    def stats(self):
+        return {
+            "decisions": self.decisions,
+            "stale_frames": self.stale,
+            "predict_ms": self.predict_seconds / self.decisions * 1000 if self.decisions else 0.0,
+        }
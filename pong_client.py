@@ -1,20 +1,44 @@
 import pygame
+import os
 import sys
 import socket
 import asyncio
-from stable_baselines3 import PPO
 import numpy as np
-
-try:
-    model = PPO.load("trained_model")
-except FileNotFoundError:
+from policy_registry import PolicyRegistry
+from policy_worker import PolicyWorker
+from profiler import FrameProfiler
+
+# One policy per difficulty tier; missing tiers fall back to the default model.
+# Files are watched, so retrained models are picked up without a restart.
+DEFAULT_POLICY_TIER = "Medium"
+POLICY_TIERS = {
+    "Easy": "trained_model_easy.zip",
+    "Medium": "trained_model.zip",
+    "Hard": "trained_model_hard.zip",
+}
+policies = PolicyRegistry(POLICY_TIERS).start()
+if policies.get(DEFAULT_POLICY_TIER) is None:
     print("Warning: 'trained_model' not found. AI vs Trained AI mode will be unavailable.")
-    model = None
+# Decisions per second the trained AI gets on top of its policy; fewer means slower reactions.
+# PONG_AI_DECISION_RATE overrides the rate for every tier.
+AI_DECISION_RATES = {"Easy": 6, "Medium": 12, "Hard": 30}
+if "PONG_AI_DECISION_RATE" in os.environ:
+    try:
+        rate = float(os.environ["PONG_AI_DECISION_RATE"])
+    except ValueError:
+        rate = 0
+    if 0 < rate <= 1000:
+        AI_DECISION_RATES = dict.fromkeys(AI_DECISION_RATES, rate)
+    else:
+        print(f"Warning: ignoring PONG_AI_DECISION_RATE={os.environ['PONG_AI_DECISION_RATE']!r}, "
+              "expected decisions per second between 0 and 1000")
 
 WIDTH, HEIGHT = 1000, 600
 FPS = 60
-SERVER_IP = "127.0.0.1"
-PORT = 5555
+SERVER_IP = os.environ.get("PONG_SERVER_IP", "127.0.0.1")
+PORT = int(os.environ.get("PONG_SERVER_PORT", 5555))
+PLAYER_NAME = os.environ.get("PONG_PLAYER_NAME", socket.gethostname())
+MAX_EXTRAPOLATED_FRAMES = 12  # keep the ball moving this long between server updates
 
 pygame.init()
 CANVAS = pygame.Surface((WIDTH, HEIGHT))
@@ -27,6 +51,8 @@ RED = (255, 0, 0)
 BLACK = (0, 0, 0)
 PADDLE_WIDTH, PADDLE_HEIGHT = 10, 100
 BALL_RADIUS = 10
+# F3 toggles the frame profiler overlay, F4 writes its samples to a CSV file
+profiler = FrameProfiler(pygame.font.Font("Roboto-Regular.ttf", 14))
 try:
     hit_sound = pygame.mixer.Sound("ping.wav")
 except pygame.error:
@@ -95,30 +121,57 @@ class NetworkedGame:
         self.score2 = 0
         self.connected = False
         self.game_over = False
+        self.tick = 0
+        self.input_seq = 0
+        self.pending_inputs = []
+        self.latest_state = None
+        self.extrapolated_frames = 0
 
     async def connect(self):
         try:
             self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
             print(f"Client: Connected to server at {self.host}:{self.port}")
-            data = await self.reader.read(100)
-            if not data:
-                print("Client: Server sent no data on connect")
-                return False
-            self.player_id = int(data.decode().strip())
-            print(f"Client: You are Player {self.player_id}")
-            self.connected = True
+            # Introduce ourselves for matchmaking; the player ID arrives once we're paired
+            self.writer.write(f"HELLO:{PLAYER_NAME}\n".encode())
+            await self.writer.drain()
             return True
         except Exception as e:
             print(f"Client: Connection failed: {e}")
             return False
 
+    async def wait_for_match(self):
+        """Shows the waiting screen until the server pairs us and sends our player ID."""
+        id_line = asyncio.ensure_future(self.reader.readline())
+        if not await show_waiting_screen(id_line):
+            id_line.cancel()
+            self.writer.close()
+            print("Client: Left the matchmaking queue")
+            return "cancelled"
+        try:
+            data = id_line.result()
+            if not data:
+                print("Client: Server closed the connection while queued")
+                return "connection_error"
+            if data.decode().strip() == "MATCH_CANCELLED":
+                print("Client: The match was called off before we joined it")
+                self.writer.close()
+                return "cancelled"
+            self.player_id = int(data.decode().strip())
+        except Exception as e:
+            print(f"Client: Matchmaking failed: {e}")
+            return "connection_error"
+        print(f"Client: You are Player {self.player_id}")
+        self.connected = True
+        return "matched"
+
     async def send_data(self, data):
         if not self.connected or self.game_over:
             print("Client: Not connected, cannot send data")
             return
         try:
-            self.writer.write(f"{data}\n".encode())
-            await self.writer.drain()
+            with profiler.stage("network"):
+                self.writer.write(f"{data}\n".encode())
+                await self.writer.drain()
         except Exception as e:
             print(f"Client: Error sending data: {e}")
             self.connected = False
@@ -139,100 +192,196 @@ class NetworkedGame:
             self.connected = False
             return None
 
+    async def read_loop(self):
+        # The server sends state at whatever rate our link allows, so read in the
+        # background and let the frame loop pick up the newest state
+        while self.connected and not self.game_over:
+            received_data = await self.receive_data()
+            if not received_data:
+                break
+            if received_data.startswith("PING:"):
+                # Answer right away so the server measures the network, not our frame rate
+                self.writer.write(f"PONG:{received_data[5:]}\n".encode())
+                continue
+            state = parse_game_state(received_data)
+            if state is not None:
+                self.latest_state = state
+            elif "GAME_OVER" in received_data:
+                self.game_over = True
+            elif received_data == "MATCH_CANCELLED":
+                print("Client: Opponent never connected, the match was called off")
+                self.game_over = True
+            else:
+                print(f"Client {self.player_id}: Received invalid data format: {received_data}")
+
+    def own_paddle(self):
+        return self.paddle1 if self.player_id == 1 else self.paddle2
+
+    def apply_state(self, state):
+        self.tick = state["tick"]
+        self.ball.x = state["ball_x"]
+        self.ball.y = state["ball_y"]
+        self.ball.vx = state["vel_x"]
+        self.ball.vy = state["vel_y"]
+        self.score1 = state["score1"]
+        self.score2 = state["score2"]
+        if self.player_id == 1:
+            self.paddle2.rect.y = state["paddle2_y"]
+            server_y, ack = state["paddle1_y"], state["ack1"]
+        else:
+            self.paddle1.rect.y = state["paddle1_y"]
+            server_y, ack = state["paddle2_y"], state["ack2"]
+        # Reconcile: start from the server's paddle and replay inputs it hasn't played yet
+        self.pending_inputs = [(seq, move) for seq, move in self.pending_inputs if seq > ack]
+        paddle = self.own_paddle()
+        paddle.rect.y = server_y
+        for _, move in self.pending_inputs:
+            apply_move(paddle, move)
+        self.extrapolated_frames = 0
+
+    def extrapolate(self):
+        """Moves the ball on by one server tick when no update arrived this frame."""
+        if self.extrapolated_frames >= MAX_EXTRAPOLATED_FRAMES:
+            return
+        self.extrapolated_frames += 1
+        self.tick += 1
+        self.ball.x += self.ball.vx
+        self.ball.y += self.ball.vy
+        if self.ball.y <= BALL_RADIUS or self.ball.y >= HEIGHT - BALL_RADIUS:
+            self.ball.vy *= -1
+
     async def game_loop(self):
         clock = pygame.time.Clock()
+        reader_task = asyncio.create_task(self.read_loop())
         run = True
         while run and self.connected:
-            clock.tick(FPS)
-            for event in pygame.event.get():
+            with profiler.stage("wait"):
+                clock.tick(FPS)
+            with profiler.stage("network"):
+                await asyncio.sleep(0)  # let the reader task take in what has arrived
+            for event in get_events():
                 if event.type == pygame.QUIT:
                     run = False
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                     action = pause_menu()
                     if action == "menu":
+                        reader_task.cancel()
                         return "menu"
                     elif action == "resume":
                         continue
 
             keys = pygame.key.get_pressed()
             if self.player_id == 1:
-                if keys[pygame.K_w]:
-                    self.paddle1.move(up=True)
-                if keys[pygame.K_s]:
-                    self.paddle1.move(up=False)
-                send_data = f"PADDLE1_Y:{self.paddle1.rect.y}"
-                await self.send_data(send_data)
-            elif self.player_id == 2:
-                if keys[pygame.K_UP]:
-                    self.paddle2.move(up=True)
-                if keys[pygame.K_DOWN]:
-                    self.paddle2.move(up=False)
-                send_data = f"PADDLE2_Y:{self.paddle2.rect.y}"
-                await self.send_data(send_data)
-
-            received_data = await self.receive_data()
-            if received_data:
-                parts = received_data.split(":")
-                if len(parts) >= 8:
-                    try:
-                        self.paddle1.rect.y = int(parts[1])
-                        self.paddle2.rect.y = int(parts[3])
-                        self.ball.x = float(parts[5])
-                        self.ball.y = float(parts[7])
-                        if len(parts) > 13:
-                            self.score1 = int(parts[13])
-                            self.score2 = int(parts[15])
-                    except ValueError as e:
-                        print(f"Client {self.player_id} Error parsing data: {e}, Data: {received_data}")
-                elif "GAME_OVER" in received_data:
-                    self.game_over = True
-                    run = False
+                move = read_move(keys, pygame.K_w, pygame.K_s)
+            else:
+                move = read_move(keys, pygame.K_UP, pygame.K_DOWN)
+            # Predict our own paddle locally and tell the server which input we used
+            self.input_seq += 1
+            apply_move(self.own_paddle(), move)
+            self.pending_inputs.append((self.input_seq, move))
+            await self.send_data(f"INPUT:{self.input_seq}:{self.tick}:{move}")
+
+            with profiler.stage("physics"):
+                if self.latest_state is not None:
+                    self.apply_state(self.latest_state)
+                    self.latest_state = None
                 else:
-                    print(f"Client {self.player_id}: Received invalid data format: {received_data}")
+                    self.extrapolate()
 
-            if not self.connected:
+            if not self.connected or self.game_over:
                 run = False
 
             if not self.game_over:
-                if received_data and len(parts) >= 8:
-                    try:
-                        self.ball.x = float(parts[5])
-                        self.ball.y = float(parts[7])
-                        self.paddle1.rect.y = int(parts[1])
-                        self.paddle2.rect.y = int(parts[3])
-                        if len(parts) > 13:
-                            self.score1 = int(parts[13])
-                            self.score2 = int(parts[15])
-                    except ValueError:
-                        pass
-                draw(self.paddle1, self.paddle2, self.ball, self.score1, self.score2)
-                WIN.blit(CANVAS, (0, 0))
-                pygame.display.update()
+                with profiler.stage("draw"):
+                    draw(self.paddle1, self.paddle2, self.ball, self.score1, self.score2)
+                present("online")
                 CANVAS.fill(BLACK)
 
+        reader_task.cancel()
         if self.writer:
             self.writer.close()
             await self.writer.wait_closed()
         return "menu"
 
+def read_move(keys, up_key, down_key):
+    if keys[up_key] and not keys[down_key]:
+        return "UP"
+    if keys[down_key] and not keys[up_key]:
+        return "DOWN"
+    return "IDLE"
+
+def apply_move(paddle, move):
+    if move == "UP":
+        paddle.move(up=True)
+    elif move == "DOWN":
+        paddle.move(up=False)
+
+def parse_game_state(message):
+    parts = message.split(":")
+    if len(parts) < 16 or len(parts) % 2:
+        return None
+    fields = dict(zip(parts[::2], parts[1::2]))
+    try:
+        return {
+            "paddle1_y": int(fields["PADDLE1_Y"]),
+            "paddle2_y": int(fields["PADDLE2_Y"]),
+            "ball_x": float(fields["BALL_X"]),
+            "ball_y": float(fields["BALL_Y"]),
+            "vel_x": float(fields.get("BALL_VEL_X", 0)),
+            "vel_y": float(fields.get("BALL_VEL_Y", 0)),
+            "score1": int(fields["SCORE1"]),
+            "score2": int(fields["SCORE2"]),
+            "tick": int(fields.get("TICK", 0)),
+            "ack1": int(fields.get("ACK1", 0)),
+            "ack2": int(fields.get("ACK2", 0)),
+        }
+    except (KeyError, ValueError) as e:
+        print(f"Client: Error parsing data: {e}, Data: {message}")
+        return None
+
 async def run_networked_game():
     game = NetworkedGame(SERVER_IP, PORT)
     if await game.connect():
+        result = await game.wait_for_match()
+        if result != "matched":
+            return result
         return await game.game_loop()
     else:
         return "connection_error"
 
+def get_events():
+    with profiler.stage("events"):
+        events = pygame.event.get()
+    for event in events:
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_F3:
+                profiler.toggle()
+            elif event.key == pygame.K_F4:
+                profiler.dump()
+    return events
+
+def present(scene):
+    profiler.draw_overlay(CANVAS)
+    with profiler.stage("display"):
+        WIN.blit(CANVAS, (0, 0))
+        pygame.display.update()
+    profiler.end_frame(scene)
+
+def render_text(font, text, antialias, color):
+    with profiler.stage("text"):
+        return font.render(text, antialias, color)
+
 def draw_center_line():
     for y in range(0, HEIGHT, 20):
         if y % 40 == 0:
             pygame.draw.line(CANVAS, WHITE, (WIDTH // 2, y), (WIDTH // 2, y + 20), 2)
 
 def draw_score(score1, score2):
-    label1 = FONT.render("Player 1", True, WHITE)
-    label2 = FONT.render("Player 2", True, WHITE)
+    label1 = render_text(FONT, "Player 1", True, WHITE)
+    label2 = render_text(FONT, "Player 2", True, WHITE)
     CANVAS.blit(label1, (WIDTH // 4 - label1.get_width() // 2, 20))
     CANVAS.blit(label2, (3 * WIDTH // 4 - label2.get_width() // 2, 20))
-    score = FONT.render(f"{score1}   {score2}", True, WHITE)
+    score = render_text(FONT, f"{score1}   {score2}", True, WHITE)
     CANVAS.blit(score, (WIDTH // 2 - score.get_width() // 2, 60))
 
 def draw(p1, p2, ball, score1, score2):
@@ -242,6 +391,30 @@ def draw(p1, p2, ball, score1, score2):
     ball.draw()
     draw_score(score1, score2)
 
+def update_ball(ball, paddle1, paddle2, score1, score2):
+    ball.update()
+    # Ball collision with paddles
+    if paddle1.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
+        ball.vx *= -1
+        if hit_sound:
+            hit_sound.play()
+    if paddle2.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
+        ball.vx *= -1
+        if hit_sound:
+            hit_sound.play()
+    # Scoring
+    if ball.x < 0:
+        score2 += 1
+        ball.x, ball.y = WIDTH // 2, HEIGHT // 2
+        ball.vx *= -1
+        ball.vy *= -1
+    if ball.x > WIDTH:
+        score1 += 1
+        ball.x, ball.y = WIDTH // 2, HEIGHT // 2
+        ball.vx *= -1
+        ball.vy *= -1
+    return score1, score2
+
 def ai_move(ball, ai_paddle, difficulty):
     speed = {"Easy": 3, "Medium": 5, "Hard": 7}[difficulty]
     if ai_paddle.rect.centery < ball.y:
@@ -250,78 +423,75 @@ def ai_move(ball, ai_paddle, difficulty):
         ai_paddle.rect.y -= speed
     ai_paddle.rect.y = max(0, min(ai_paddle.rect.y, HEIGHT - PADDLE_HEIGHT))
 
-def trained_ai_move(ball, paddle2):
+def trained_policy(tier=DEFAULT_POLICY_TIER):
+    model = policies.get(tier)
     if model is None:
-        return
+        model = policies.get(DEFAULT_POLICY_TIER)
+    return model
+
+def trained_ai_observation(ball):
     obs = [ball.x, ball.y, 0, 0]
-    obs = np.array(obs).reshape(1, -1)
-    action, _states = model.predict(obs, deterministic=True)
+    return np.array(obs).reshape(1, -1)
+
+def trained_ai_move(paddle2, action):
     if action == 0:
         paddle2.move(up=True)
     elif action == 1:
         paddle2.move(up=False)
         
-def play_vs_trained_ai():
+def play_vs_trained_ai(tier=DEFAULT_POLICY_TIER):
     paddle1 = Paddle(20)
     paddle2 = Paddle(WIDTH - PADDLE_WIDTH - 20)
     ball = Ball(WIDTH // 2, HEIGHT // 2)
     clock = pygame.time.Clock()
     score1 = score2 = 0
+    # predict() runs on the worker thread; the frame only hands over the ball and reads the last decision
+    ai = PolicyWorker(lambda: trained_policy(tier), AI_DECISION_RATES.get(tier, FPS), FPS,
+                      on_predict=lambda seconds: profiler.record("predict", seconds)).start()
+    frame = 0
     run = True
-    while run:
-        clock.tick(FPS)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                action = pause_menu()
-                if action == "menu":
-                    return
-                elif action == "resume":
-                    continue
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_w]:
-            paddle1.move(up=True)
-        if keys[pygame.K_s]:
-            paddle1.move(up=False)
-        trained_ai_move(ball, paddle2)
-        ball.update()
-        # Ball collision with paddles
-        if paddle1.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
-            ball.vx *= -1
-            if hit_sound:
-                hit_sound.play()
-        if paddle2.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
-            ball.vx *= -1
-            if hit_sound:
-                hit_sound.play()
-        # Scoring
-        if ball.x < 0:
-            score2 += 1
-            ball.x, ball.y = WIDTH // 2, HEIGHT // 2
-            ball.vx *= -1
-            ball.vy *= -1
-        if ball.x > WIDTH:
-            score1 += 1
-            ball.x, ball.y = WIDTH // 2, HEIGHT // 2
-            ball.vx *= -1
-            ball.vy *= -1
-        draw(paddle1, paddle2, ball, score1, score2)
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
-        CANVAS.fill(BLACK)
+    try:
+        while run:
+            with profiler.stage("wait"):
+                clock.tick(FPS)
+            for event in get_events():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    action = pause_menu()
+                    if action == "menu":
+                        return
+                    elif action == "resume":
+                        continue
+            keys = pygame.key.get_pressed()
+            if keys[pygame.K_w]:
+                paddle1.move(up=True)
+            if keys[pygame.K_s]:
+                paddle1.move(up=False)
+            with profiler.stage("ai"):
+                frame += 1
+                ai.observe(trained_ai_observation(ball), frame)
+                trained_ai_move(paddle2, ai.action())
+            with profiler.stage("physics"):
+                score1, score2 = update_ball(ball, paddle1, paddle2, score1, score2)
+            with profiler.stage("draw"):
+                draw(paddle1, paddle2, ball, score1, score2)
+            present("vs trained AI")
+            CANVAS.fill(BLACK)
+    finally:
+        ai.stop()
+        print(f"Trained AI: {ai.stats()}")
 
 def pause_menu():
     options = ["R - Resume", "M - Main Menu", "Q - Quit"]
     while True:
         CANVAS.fill(BLACK)
         for i, opt in enumerate(options):
-            txt = FONT.render(opt, True, WHITE)
+            txt = render_text(FONT, opt, True, WHITE)
             CANVAS.blit(txt, (WIDTH // 2 - txt.get_width() // 2, 200 + i * 60))
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
-        for event in pygame.event.get():
+        present("pause menu")
+        for event in get_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -339,15 +509,14 @@ def main_menu():
     selected = 0
     while True:
         CANVAS.blit(menu_bg, (0, 0))
-        title = BIG_FONT.render("PONG GAME", True, WHITE)
+        title = render_text(BIG_FONT, "PONG GAME", True, WHITE)
         CANVAS.blit(title, (WIDTH // 2 - title.get_width() // 2, 60))
         for i, opt in enumerate(options):
             color = RED if i == selected else WHITE
-            txt = FONT.render(opt, True, color)
+            txt = render_text(FONT, opt, True, color)
             CANVAS.blit(txt, (WIDTH // 2 - txt.get_width() // 2, 200 + i * 60))
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
-        for event in pygame.event.get():
+        present("main menu")
+        for event in get_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -364,15 +533,14 @@ def difficulty_menu():
     selected = 0
     while True:
         CANVAS.blit(menu_bg, (0, 0))
-        txt = FONT.render("Select Difficulty:", True, WHITE)
+        txt = render_text(FONT, "Select Difficulty:", True, WHITE)
         CANVAS.blit(txt, (WIDTH // 2 - txt.get_width() // 2, 100))
         for i, opt in enumerate(options):
             color = RED if i == selected else WHITE
-            txt = FONT.render(opt, True, color)
+            txt = render_text(FONT, opt, True, color)
             CANVAS.blit(txt, (WIDTH // 2 - txt.get_width() // 2, 250 + i * 50))
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
-        for event in pygame.event.get():
+        present("difficulty menu")
+        for event in get_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -387,48 +555,52 @@ def difficulty_menu():
                     else:
                         return options[selected]
 
-def show_waiting_screen():
-    while True:
+async def show_waiting_screen(matched):
+    """Keeps the window responsive while queued: True once matched completes, False on ESC."""
+    while not matched.done():
         CANVAS.blit(menu_bg, (0, 0))
-        txt = FONT.render("Waiting for another player to join...", True, WHITE)
-        esc_txt = FONT.render("Press ESC to cancel", True, RED)
+        txt = render_text(FONT, "Waiting for another player to join...", True, WHITE)
+        esc_txt = render_text(FONT, "Press ESC to cancel", True, RED)
         CANVAS.blit(txt, (WIDTH // 2 - txt.get_width() // 2, HEIGHT // 2 - 50))
         CANVAS.blit(esc_txt, (WIDTH // 2 - esc_txt.get_width() // 2, HEIGHT // 2 + 10))
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
+        present("waiting")
         CANVAS.fill(BLACK)
-        for event in pygame.event.get():
+        for event in get_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                 return False
-        pygame.time.delay(100)
+        with profiler.stage("wait"):
+            await asyncio.wait({matched}, timeout=0.1)
+    return True
 
 def show_connection_error():
     while True:
         CANVAS.blit(menu_bg, (0, 0))
-        txt = FONT.render("Connection Failed!", True, RED)
-        esc_txt = FONT.render("Press ESC to return to menu", True, WHITE)
+        txt = render_text(FONT, "Connection Failed!", True, RED)
+        esc_txt = render_text(FONT, "Press ESC to return to menu", True, WHITE)
         CANVAS.blit(txt, (WIDTH // 2 - txt.get_width() // 2, HEIGHT // 2 + 10))
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
+        present("connection error")
         CANVAS.fill(BLACK)
-        for event in pygame.event.get():
+        for event in get_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                 return  # Return to the main menu
-        pygame.time.delay(100) # Add delay
+        with profiler.stage("wait"):
+            pygame.time.delay(100) # Add delay
 
 async def play_online():
     game = NetworkedGame(SERVER_IP, PORT)
     if await game.connect():
-        # Show waiting screen here
-        if show_waiting_screen() == False:
+        # The waiting screen stays up until the server pairs us
+        result = await game.wait_for_match()
+        if result == "cancelled":
             return
-        result = await game.game_loop()
+        if result == "matched":
+            result = await game.game_loop()
         if result == "connection_error":
             show_connection_error()
         elif result == "menu":
@@ -445,8 +617,9 @@ def play_local():
     score2 = 0
     run = True
     while run:
-        clock.tick(FPS)
-        for event in pygame.event.get():
+        with profiler.stage("wait"):
+            clock.tick(FPS)
+        for event in get_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -465,30 +638,11 @@ def play_local():
             paddle2.move(up=True)
         if keys[pygame.K_DOWN]:
             paddle2.move(up=False)
-        ball.update()
-        # Ball collision with paddles
-        if paddle1.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
-            ball.vx *= -1
-            if hit_sound:
-                hit_sound.play()
-        if paddle2.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
-            ball.vx *= -1
-            if hit_sound:
-                hit_sound.play()
-        # Scoring
-        if ball.x < 0:
-            score2 += 1
-            ball.x, ball.y = WIDTH // 2, HEIGHT // 2
-            ball.vx *= -1
-            ball.vy *= -1
-        if ball.x > WIDTH:
-            score1 += 1
-            ball.x, ball.y = WIDTH // 2, HEIGHT // 2
-            ball.vx *= -1
-            ball.vy *= -1
-        draw(paddle1, paddle2, ball, score1, score2)
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
+        with profiler.stage("physics"):
+            score1, score2 = update_ball(ball, paddle1, paddle2, score1, score2)
+        with profiler.stage("draw"):
+            draw(paddle1, paddle2, ball, score1, score2)
+        present("local")
         CANVAS.fill(BLACK)
 
 def play_vs_ai(difficulty="Medium"):
@@ -500,8 +654,9 @@ def play_vs_ai(difficulty="Medium"):
     score2 = 0
     run = True
     while run:
-        clock.tick(FPS)
-        for event in pygame.event.get():
+        with profiler.stage("wait"):
+            clock.tick(FPS)
+        for event in get_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -516,31 +671,13 @@ def play_vs_ai(difficulty="Medium"):
             paddle1.move(up=True)
         if keys[pygame.K_s]:
             paddle1.move(up=False)
-        ai_move(ball, paddle2, difficulty)
-        ball.update()
-        # Ball collision with paddles
-        if paddle1.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
-            ball.vx *= -1
-            if hit_sound:
-                hit_sound.play()
-        if paddle2.rect.colliderect(ball.x - BALL_RADIUS, ball.y - BALL_RADIUS, BALL_RADIUS * 2, BALL_RADIUS * 2):
-            ball.vx *= -1
-            if hit_sound:
-                hit_sound.play()
-        # Scoring
-        if ball.x < 0:
-            score2 += 1
-            ball.x, ball.y = WIDTH // 2, HEIGHT // 2
-            ball.vx *= -1
-            ball.vy *= -1
-        if ball.x > WIDTH:
-            score1 += 1
-            ball.x, ball.y = WIDTH // 2, HEIGHT // 2
-            ball.vx *= -1
-            ball.vy *= -1
-        draw(paddle1, paddle2, ball, score1, score2)
-        WIN.blit(CANVAS, (0, 0))
-        pygame.display.update()
+        with profiler.stage("ai"):
+            ai_move(ball, paddle2, difficulty)
+        with profiler.stage("physics"):
+            score1, score2 = update_ball(ball, paddle1, paddle2, score1, score2)
+        with profiler.stage("draw"):
+            draw(paddle1, paddle2, ball, score1, score2)
+        present("vs AI")
         CANVAS.fill(BLACK)
 
 def main():
@@ -553,7 +690,9 @@ def main():
             if level:
                 play_vs_ai(level)
         elif choice == "Play vs Trained AI":
-            play_vs_trained_ai()
+            level = difficulty_menu()
+            if level:
+                play_vs_trained_ai(level)
         elif choice == "Online Multiplayer":
             asyncio.run(play_online())
         elif choice == "Quit":
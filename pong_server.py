@@ -1,12 +1,324 @@
 import asyncio
 import socket
-import pygame 
-import random
+import bisect
+import functools
+import heapq
+import itertools
+import math
+import sqlite3
+import threading
+import time
+import numpy as np
+from event_log import EventLog
+from match_store import MatchStore, JITTER_BUFFER_TICKS, MAX_REWIND_TICKS
+
+TICK_RATE = 60
+MAX_SEND_BUFFER = 64 * 1024  # skip state updates to a client whose socket is this backed up
+
+# Per-client update rate, as ticks between state updates (1 = every tick, 6 = 10 per second)
+MIN_UPDATE_INTERVAL = 1
+MAX_UPDATE_INTERVAL = 6
+PING_INTERVAL_TICKS = 30
+RTT_UPDATE_INTERVALS = ((0.06, 1), (0.12, 2))  # (RTT up to, interval); slower links get 3
+CONGESTED_BUFFER = 8 * 1024  # unsent bytes that mean the link can't keep up
+CONGESTED_QUEUEING = 0.1  # RTT this far above the link's best means packets are queueing
+THROUGHPUT_HEADROOM = 1.1  # writing this much more than the link delivers means it is the bottleneck
+
+# Client inputs: one per client frame, buffered in the match store and applied one per server tick
+MOVES = {"UP": -1, "DOWN": 1, "IDLE": 0}
+REWIND_SLACK_TICKS = 3  # extra rewind allowed on top of a client's measured lag, for RTT jitter
+
+WINNING_SCORE = 11
+GAME_OVER_TIMEOUT = 2  # seconds to flush GAME_OVER to both players before hanging up
+MATCH_START_TIMEOUT = 5  # seconds both matched players have to connect before it's called off
+
+# Matchmaking: players are paired with the closest rating inside a search window
+# that widens the longer they wait
+MATCHMAKING_INTERVAL = 0.5
+MATCHMAKING_SLICE = 100  # most pairs started before giving the game loop a turn
+BASE_SEARCH_WINDOW = 50
+SEARCH_WIDEN_PER_SECOND = 25
+MAX_SEARCH_WINDOW = 800
+
+RATINGS_DB = "ratings.db"
+DEFAULT_RATING = 1200
+ELO_K = 32
+RATINGS_FLUSH_INTERVAL = 5.0
+RATINGS_BATCH_SIZE = 500
+
+EVENT_LOG_DIR = "logs"
+
+match_ids = itertools.count(1)
+
+
+class ClientLink:
+    """RTT and throughput of one client connection, and the update rate they allow.
+
+    The server pings every client twice a second. Until the first pong the
+    link gets every update. From then on the measured RTT picks a
+    base update interval. When less left the server than was written since
+    the last ping, the link's throughput is the limit and the interval is
+    stretched until the updates fit in it. Other signs of congestion (unsent
+    bytes piling up, RTT rising above its best, pings going unanswered)
+    double the interval. Once the link recovers, the interval comes back
+    down one step per ping.
+    """
+
+    def __init__(self, writer, on_update=None):
+        self.writer = writer
+        self.on_update = on_update  # called with the link whenever its interval or rewind limit is set
+        self.pings = {}  # ping id -> time sent
+        self.next_ping = 0
+        self.rtt = None
+        self.min_rtt = None
+        self.interval = MIN_UPDATE_INTERVAL
+        self.rewind_ticks = 0
+        self.update_rewind()
+        self.bytes_sent = 0
+        self.sample = None  # (time, bytes sent, unsent bytes) at the last ping
+        self.throughput = None  # bytes per second that left the server
+        self.offered = None  # bytes per second written for this client since the last ping
+        self.delivered = None  # and how many of those per second left the server
+
+    def ping(self, now):
+        buffered = self.writer.transport.get_write_buffer_size()
+        if self.sample is not None and now > self.sample[0]:
+            then, sent, then_buffered = self.sample
+            written = self.bytes_sent - sent
+            delivered = max(0, written - (buffered - then_buffered))
+            self.offered = written / (now - then)
+            self.delivered = delivered / (now - then)
+            self.throughput = (self.delivered if self.throughput is None
+                               else 0.75 * self.throughput + 0.25 * self.delivered)
+        self.sample = (now, self.bytes_sent, buffered)
+
+        self.adapt(buffered)
+        for ping_id, sent_at in list(self.pings.items()):
+            if now - sent_at > 5:
+                del self.pings[ping_id]  # lost
+        self.next_ping += 1
+        self.pings[self.next_ping] = now
+        data = f"PING:{self.next_ping}\n".encode()
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+
+    def on_pong(self, ping_id, now):
+        sent_at = self.pings.pop(ping_id, None)
+        if sent_at is None:
+            return
+        sample = now - sent_at
+        self.rtt = sample if self.rtt is None else 0.75 * self.rtt + 0.25 * sample
+        self.min_rtt = sample if self.min_rtt is None else min(self.min_rtt, sample)
+        self.update_rewind()
+
+    def update_rewind(self):
+        """How far back this client's view can honestly be: its RTT, the jitter buffer and the update interval."""
+        rtt_ticks = math.ceil(self.rtt * TICK_RATE) if self.rtt is not None else 0
+        self.rewind_ticks = min(rtt_ticks + JITTER_BUFFER_TICKS + self.interval + REWIND_SLACK_TICKS,
+                                MAX_REWIND_TICKS)
+        if self.on_update is not None:
+            self.on_update(self)
+
+    def adapt(self, buffered):
+        if self.rtt is None:
+            return  # nothing measured yet, keep sending every update until the first pong
+        if self.offered is not None and self.offered > self.delivered * THROUGHPUT_HEADROOM:
+            # More is being written than gets through: send only as often as the link can carry
+            fit = math.ceil(self.interval * self.offered / max(self.delivered, 1))
+            self.interval = min(max(fit, self.interval + 1), MAX_UPDATE_INTERVAL)
+            self.update_rewind()
+            return
+        congested = (
+            buffered > CONGESTED_BUFFER
+            or len(self.pings) >= 2
+            or self.rtt - self.min_rtt > CONGESTED_QUEUEING
+        )
+        if congested:
+            self.interval = min(self.interval * 2, MAX_UPDATE_INTERVAL)
+            self.update_rewind()
+            return
+        target = 3
+        for limit, interval in RTT_UPDATE_INTERVALS:
+            if self.rtt <= limit:
+                target = interval
+                break
+        self.interval = max(target, self.interval - 1) if self.interval > target else target
+        self.update_rewind()
+
+    def send(self, data):
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+
+    def stats(self):
+        return {
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "throughput_kbps": round(self.throughput * 8 / 1000, 1) if self.throughput is not None else None,
+            "update_interval": self.interval,
+        }
+
+
+class RatingStore:
+    """Elo ratings kept in SQLite; updates are cached and written in batches."""
+
+    def __init__(self, path=RATINGS_DB):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS ratings "
+                "(name TEXT PRIMARY KEY, rating REAL NOT NULL, matches INTEGER NOT NULL)"
+            )
+        self.cache = {}
+        self.dirty = set()
+        self.flushing = None
+
+    def load(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT rating, matches FROM ratings WHERE name = ?", (name,)).fetchone()
+        return tuple(row) if row else (DEFAULT_RATING, 0)
+
+    async def get(self, name):
+        if name not in self.cache:
+            row = await asyncio.to_thread(self.load, name)
+            self.cache.setdefault(name, row)
+        return self.cache[name][0]
+
+    def record_match(self, winner, loser):
+        """Applies an Elo update; the write happens with the next batch."""
+        if winner == loser:
+            return 0.0  # nobody gains rating by beating themself
+        winner_rating, winner_matches = self.cache.get(winner, (DEFAULT_RATING, 0))
+        loser_rating, loser_matches = self.cache.get(loser, (DEFAULT_RATING, 0))
+        expected = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
+        change = ELO_K * (1 - expected)
+        self.cache[winner] = (winner_rating + change, winner_matches + 1)
+        self.cache[loser] = (loser_rating - change, loser_matches + 1)
+        self.dirty.update((winner, loser))
+        if len(self.dirty) >= RATINGS_BATCH_SIZE:
+            self.schedule_flush()
+        return change
+
+    def write(self, rows):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO ratings (name, rating, matches) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET rating = excluded.rating, matches = excluded.matches",
+                rows,
+            )
+
+    def schedule_flush(self):
+        """Hands the pending updates to a worker thread so the event loop never waits on disk."""
+        if not self.dirty or (self.flushing is not None and not self.flushing.done()):
+            return self.flushing
+        rows = [(name, *self.cache[name]) for name in self.dirty]
+        self.dirty.clear()
+        self.flushing = asyncio.ensure_future(asyncio.to_thread(self.write, rows))
+        return self.flushing
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(RATINGS_FLUSH_INTERVAL)
+            self.schedule_flush()
+
+    async def close(self):
+        if self.flushing is not None:
+            await self.flushing
+        if self.dirty:
+            await self.schedule_flush()
+        self.conn.close()
+
+
+class Ticket:
+    """A player waiting in the matchmaking queue."""
+
+    def __init__(self, name, account, rating, seq):
+        self.name = name
+        self.account = account  # the name as the player gave it, which their rating is kept under
+        self.rating = rating
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.matched = asyncio.get_running_loop().create_future()
+
+    def reaches(self, gap):
+        """When this ticket's search window first covers a rating gap, inf if it never will."""
+        if gap > MAX_SEARCH_WINDOW:
+            return math.inf
+        return self.enqueued_at + max(gap - BASE_SEARCH_WINDOW, 0) / SEARCH_WIDEN_PER_SECOND
+
+
+class Matchmaker:
+    """Waiting players kept sorted by rating and paired by a periodic sweep.
+
+    Every pair of rating neighbours is scheduled for the time the wider of
+    their two search windows covers the gap between them. A sweep only looks
+    at the pairs that are due, so it doesn't walk the whole queue.
+    """
+
+    def __init__(self):
+        self.queue = []  # (rating, seq, ticket), sorted
+        self.candidates = []  # heap of (due, seq, seq, ticket, ticket) for neighbouring tickets
+        self.next_seq = 0
+
+    def enqueue(self, name, rating, account=None):
+        ticket = Ticket(name, account if account is not None else name, rating, self.next_seq)
+        self.next_seq += 1
+        index = bisect.bisect_left(self.queue, (rating, ticket.seq))
+        self.queue.insert(index, (rating, ticket.seq, ticket))
+        self.schedule(index - 1)
+        self.schedule(index)
+        return ticket
+
+    def index(self, ticket):
+        index = bisect.bisect_left(self.queue, (ticket.rating, ticket.seq))
+        if index < len(self.queue) and self.queue[index][2] is ticket:
+            return index
+        return None
+
+    def cancel(self, ticket):
+        index = self.index(ticket)
+        if index is not None:
+            del self.queue[index]
+            self.schedule(index - 1)
+
+    def schedule(self, index):
+        """Schedules the neighbours at index and index + 1 for when they can be paired."""
+        if index < 0 or index + 1 >= len(self.queue):
+            return
+        a, b = self.queue[index][2], self.queue[index + 1][2]
+        due = min(a.reaches(b.rating - a.rating), b.reaches(b.rating - a.rating))
+        if due != math.inf:
+            heapq.heappush(self.candidates, (due, a.seq, b.seq, a, b))
+
+    def pair(self, now, limit=None):
+        """Pairs rating neighbours whose gap fits either player's search window, at most limit pairs."""
+        pairs = []
+        while self.candidates and self.candidates[0][0] <= now and len(pairs) != limit:
+            _due, _, _, a, b = heapq.heappop(self.candidates)
+            index = self.index(a)
+            if index is None or index + 1 >= len(self.queue) or self.queue[index + 1][2] is not b:
+                continue  # no longer neighbours, whoever split them scheduled their own pairs
+            del self.queue[index:index + 2]
+            self.schedule(index - 1)
+            pairs.append((a, b))
+        return pairs
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(MATCHMAKING_INTERVAL)
+            now = time.monotonic()
+            while True:
+                pairs = self.pair(now, MATCHMAKING_SLICE)
+                if not pairs:
+                    break
+                for a, b in pairs:
+                    start_match(a, b)
+                await asyncio.sleep(0)  # let the game loop tick between slices
 
 async def handle_client(reader, writer, player_id, game_state):
     """Handles communication with a single client."""
     addr = writer.get_extra_info('peername')
     print(f"Server: Connected by {addr} as Player {player_id}")
+    reason = "closed"
 
     try:
         # Send the player ID to the client
@@ -16,132 +328,336 @@ async def handle_client(reader, writer, player_id, game_state):
         async for line in reader:
             try:
                 data = line.decode().strip()
-                print(f"Server Received from Player {player_id}: {data}")
                 if not data:
                     continue
 
-                # Update game state based on client input
-                if player_id == 1 and data.startswith("PADDLE1_Y:"):
+                # Queue the client's input for the tick it belongs to
+                if data.startswith("INPUT:"):
                     try:
-                        game_state["paddle1_y"] = int(data.split(":")[1])
-                    except ValueError:
+                        _, seq, seen_tick, move = data.split(":")
+                        push_input(game_state, player_id, int(seq), int(seen_tick), MOVES[move])
+                    except (ValueError, KeyError):
                         pass
-                elif player_id == 2 and data.startswith("PADDLE2_Y:"):
+                elif data.startswith("PONG:"):
                     try:
-                        game_state["paddle2_y"] = int(data.split(":")[1])
-                    except ValueError:
+                        game_state["links"][player_id].on_pong(int(data.split(":")[1]), time.monotonic())
+                    except (ValueError, KeyError):
                         pass
 
             except Exception as e:
                 print(f"Server: Error processing data from Player {player_id}: {e}")
+                reason = "error"
                 break
 
     except ConnectionResetError:
         print(f"Server: Player {player_id} disconnected unexpectedly.")
+        reason = "reset"
     finally:
         print(f"Server: Closed connection with Player {player_id}")
-        if player_id in game_state["players"]:
-            del game_state["players"][player_id]
+        link = game_state["links"].pop(player_id, None)
+        events.log("disconnect", match=game_state["match_id"], player=player_id,
+                   name=game_state["names"][player_id], reason=reason, tick=match_tick(game_state),
+                   **(link.stats() if link is not None else {}))
+        leave_match(game_state, player_id)
         writer.close()
 
-async def broadcast_game_state(state, players):
-    """Broadcasts the current game state to all connected players."""
-    game_data_str = (
-        f"PADDLE1_Y:{state.get('paddle1_y', 300)}:"
-        f"PADDLE2_Y:{state.get('paddle2_y', 300)}:"
-        f"BALL_X:{state.get('ball_x', 500)}:"
-        f"BALL_Y:{state.get('ball_y', 300)}:"
-        f"BALL_VEL_X:{state.get('ball_vel_x', 5)}:"
-        f"BALL_VEL_Y:{state.get('ball_vel_y', 5)}:"
-        f"SCORE1:{state.get('score1', 0)}:"
-        f"SCORE2:{state.get('score2', 0)}\n"
+def encode_game_state(paddle1_y, paddle2_y, ball_x, ball_y, vel_x, vel_y, score1, score2, tick, ack1, ack2):
+    return (
+        f"PADDLE1_Y:{paddle1_y}:"
+        f"PADDLE2_Y:{paddle2_y}:"
+        f"BALL_X:{ball_x}:"
+        f"BALL_Y:{ball_y}:"
+        f"BALL_VEL_X:{vel_x}:"
+        f"BALL_VEL_Y:{vel_y}:"
+        f"SCORE1:{score1}:"
+        f"SCORE2:{score2}:"
+        f"TICK:{tick}:"
+        f"ACK1:{ack1}:"
+        f"ACK2:{ack2}\n"
+    ).encode()
+
+def broadcast_game_state(store, slots):
+    """Sends each player of the listed matches the current state when their update rate is due.
+
+    Nothing here waits on a socket.
+    """
+    tick = store.tick[slots]
+    vel_x = store.vel_x[slots]
+    interval = store.update_interval[slots]
+    # Updates come twice as often while the ball is heading toward the player
+    toward = np.stack((vel_x < 0, vel_x > 0), axis=1)
+    interval = np.where(toward, np.maximum(MIN_UPDATE_INTERVAL, interval // 2), interval)
+    due = store.connected[slots] & (tick[:, None] - store.last_sent_tick[slots] >= interval)
+    rows = np.flatnonzero(due.any(axis=1))
+    if rows.size == 0:
+        return
+    due_slots = slots[rows]
+    columns = zip(
+        store.paddle_y[due_slots, 0].tolist(), store.paddle_y[due_slots, 1].tolist(),
+        store.ball_x[due_slots].tolist(), store.ball_y[due_slots].tolist(),
+        store.vel_x[due_slots].tolist(), store.vel_y[due_slots].tolist(),
+        store.score[due_slots, 0].tolist(), store.score[due_slots, 1].tolist(),
+        tick[rows].tolist(), store.ack[due_slots, 0].tolist(), store.ack[due_slots, 1].tolist(),
     )
-    game_data = game_data_str.encode()
-    print(f"Server Broadcasting: {game_data_str.strip()}")
-
-    for writer in players.values():
-        try:
-            writer.write(game_data)
-            await writer.drain()
-        except ConnectionError:
-            pass
-
-async def game_logic(game_state):
-    """Manages the game logic and updates the game state."""
-    width, height = 1000, 600
-    ball_radius = 10
-    paddle_height = 100
-    paddle_width = 10
-
-    while True:
-        if len(game_state["players"]) == 2:
-            # Get paddle positions
-            p1_y = game_state.get("paddle1_y", height // 2 - paddle_height // 2)
-            p2_y = game_state.get("paddle2_y", height // 2 - paddle_height // 2)
-
-            # Update ball position
-            game_state["ball_x"] += game_state["ball_vel_x"]
-            game_state["ball_y"] += game_state["ball_vel_y"]
-
-            # Ball collision with top/bottom walls
-            if game_state["ball_y"] <= ball_radius or game_state["ball_y"] >= height - ball_radius:
-                game_state["ball_vel_y"] *= -1
-
-            # Ball collision with paddles
-            paddle1_rect = pygame.Rect(20, p1_y, paddle_width, paddle_height)
-            paddle2_rect = pygame.Rect(width - paddle_width - 20, p2_y, paddle_width, paddle_height)
-            ball_rect = pygame.Rect(game_state["ball_x"] - ball_radius, game_state["ball_y"] - ball_radius, ball_radius * 2, ball_radius * 2)
-
-            if ball_rect.colliderect(paddle1_rect) and game_state["ball_vel_x"] < 0:
-                game_state["ball_vel_x"] *= -1
-                game_state["ball_vel_y"] += random.uniform(-2, 2)
-            elif ball_rect.colliderect(paddle2_rect) and game_state["ball_vel_x"] > 0:
-                game_state["ball_vel_x"] *= -1
-                game_state["ball_vel_y"] += random.uniform(-2, 2)
-
-            # Scoring
-            if game_state["ball_x"] < 0:
-                game_state["score2"] += 1
-                game_state["ball_x"], game_state["ball_y"] = width // 2, height // 2
-                game_state["ball_vel_x"] = abs(game_state["ball_vel_x"])
-                game_state["ball_vel_y"] = random.uniform(-5, 5)
-            elif game_state["ball_x"] > width:
-                game_state["score1"] += 1
-                game_state["ball_x"], game_state["ball_y"] = width // 2, height // 2
-                game_state["ball_vel_x"] = -abs(game_state["ball_vel_x"])
-                game_state["ball_vel_y"] = random.uniform(-5, 5)
-
-            # Keep velocities within reasonable bounds
-            game_state["ball_vel_x"] = max(-10, min(game_state["ball_vel_x"], 10))
-            game_state["ball_vel_y"] = max(-10, min(game_state["ball_vel_y"], 10))
-
-            # Broadcast game state
-            await broadcast_game_state(game_state, game_state["players"])
-        else:
-            await asyncio.sleep(0.1)  # reduced cpu usage
+    sent_rows, sent_sides = [], []
+    for row, slot, values, due_players in zip(rows.tolist(), due_slots.tolist(), columns, due[rows].tolist()):
+        game_state = matches[slot]
+        game_data = encode_game_state(*values)
+        for side, player_due in enumerate(due_players):
+            if not player_due:
+                continue
+            writer = game_state["players"][side + 1]
+            # A client that can't keep up just misses updates instead of stalling every match
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_SEND_BUFFER:
+                continue
+            game_state["links"][side + 1].send(game_data)
+            sent_rows.append(row)
+            sent_sides.append(side)
+    store.last_sent_tick[slots[sent_rows], sent_sides] = tick[sent_rows]
 
-async def serve_client(reader, writer):
-    """Handles a new client connection."""
-    global next_player_id
-    player_id = next_player_id
+def ping_clients():
+    now = time.monotonic()
+    for game_state in matches.values():
+        for link in game_state["links"].values():
+            if not link.writer.is_closing():
+                link.ping(now)
+
+def match_tick(game_state):
+    """The match's current tick, or its last one once it has finished and given up its slot."""
+    if game_state["finished"]:
+        return game_state["ticks"]
+    return int(store.tick[game_state["slot"]])
+
+def end_match(game_state, winner, reason):
+    """Records the result, closes the match and tells the players who won in the background."""
+    slot = game_state["slot"]
+    score1, score2 = store.score[slot].tolist()
+    loser = 2 if winner == 1 else 1
+    # Rated by account, so a second connection under the same name is still self-play
+    accounts = game_state["accounts"]
+    change = ratings.record_match(accounts[winner], accounts[loser])
+    events.log("match_end", match=game_state["match_id"], winner=game_state["names"][winner],
+               loser=game_state["names"][loser], score=[score1, score2],
+               reason=reason, ticks=game_state["ticks"], rating_change=round(change, 2))
+    print(f"Server: Match over, {game_state['names'][winner]} beat {game_state['names'][loser]} "
+          f"{max(score1, score2)}-{min(score1, score2)}")
+    del matches[slot]
+    store.release(slot)
+    asyncio.create_task(hang_up(list(game_state["players"].values()), f"GAME_OVER:{winner}\n".encode()))
+
+def call_off_match(game_state):
+    """Gives up a match that never started, rating nobody, and tells whoever did connect."""
+    stop_match(game_state)
+    present = [game_state["names"][player_id] for player_id in game_state["players"]]
+    events.log("match_cancelled", match=game_state["match_id"], connected=present, reason="no_show")
+    print(f"Server: Called off match {game_state['match_id']}, "
+          f"{' and '.join(game_state['names'].values())} didn't both connect")
+    del matches[game_state["slot"]]
+    store.release(game_state["slot"])
+    asyncio.create_task(hang_up(list(game_state["players"].values()), b"MATCH_CANCELLED\n"))
+
+async def hang_up(writers, message):
+    """Sends a last message to the players and hangs up, not waiting on a stalled client for long."""
+    for writer in writers:
+        writer.write(message)
+    try:
+        await asyncio.wait_for(asyncio.gather(*(writer.drain() for writer in writers), return_exceptions=True),
+                               GAME_OVER_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    for writer in writers:
+        writer.close()
+
+def stop_match(game_state):
+    store.running[game_state["slot"]] = False
+    game_state["finished"] = True
+    game_state["ticks"] = int(store.tick[game_state["slot"]])  # the slot is about to be reused
+
+def finish_match(game_state, winner, reason):
+    """Stops stepping a match and wraps it up."""
+    stop_match(game_state)
+    if winner is None:
+        # Both players are gone, there is nobody to tell or rate, but the match still needs a result
+        events.log("match_end", match=game_state["match_id"], winner=None, loser=None,
+                   score=store.score[game_state["slot"]].tolist(), reason="abandoned",
+                   ticks=game_state["ticks"], rating_change=0.0)
+        del matches[game_state["slot"]]
+        store.release(game_state["slot"])
+        return
+    end_match(game_state, winner, reason)
+
+def collect_inputs(store):
+    """Hands each running match its players' next buffered inputs, ending abandoned matches."""
+    ready = store.in_use & store.connected.all(axis=1)
+    store.started |= ready
+    store.running[:] = ready
+    # Only matches missing a player need looking at one by one
+    for slot in np.flatnonzero(store.in_use & ~ready).tolist():
+        game_state = matches[slot]
+        if store.started[slot]:
+            # A player left mid-match, the one still here wins by forfeit
+            finish_match(game_state, next(iter(game_state["players"]), None), "forfeit")
+        elif time.monotonic() - game_state["created"] > MATCH_START_TIMEOUT:
+            # A matched player dropped before kick-off, so there is no result to rate
+            call_off_match(game_state)
+    slots = np.flatnonzero(ready)
+    if slots.size:
+        store.pop_inputs(slots)
+        # Never rewind further than the player's measured lag could explain
+        ticks = store.tick[slots][:, None]
+        store.seen_tick[slots] = np.clip(store.view_tick[slots], ticks - store.rewind_ticks[slots], ticks)
+
+def run_tick(store, loop_count):
+    """One server tick: apply inputs, step every match, send the results and settle won matches."""
+    collect_inputs(store)
+    scored_slots, scorers = store.step()
+    for slot, scorer in zip(scored_slots.tolist(), scorers.tolist()):
+        game_state = matches[slot]
+        events.log("point", match=game_state["match_id"], player=scorer,
+                   name=game_state["names"][scorer], tick=int(store.tick[slot]),
+                   score=store.score[slot].tolist())
+
+    running = np.flatnonzero(store.running)
+    broadcast_game_state(store, running)
+    if loop_count % PING_INTERVAL_TICKS == 0:
+        ping_clients()
+
+    won = running[store.score[running].max(axis=1) >= WINNING_SCORE]
+    for slot in won.tolist():
+        score1, score2 = store.score[slot].tolist()
+        finish_match(matches[slot], 1 if score1 > score2 else 2, "score")
+
+async def game_logic(store):
+    """Runs a tick of every match TICK_RATE times a second."""
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    for loop_count in itertools.count():
+        run_tick(store, loop_count)
+
+        next_tick += 1 / TICK_RATE
+        delay = next_tick - loop.time()
+        if delay < -1 / TICK_RATE:
+            next_tick = loop.time()  # too far behind, don't try to catch up
+        await asyncio.sleep(max(0, delay))
+
+def new_game_state(names, accounts=None):
+    return {
+        "slot": store.allocate(),
+        "match_id": next(match_ids),
+        "created": time.monotonic(),
+        "finished": False,
+        "names": names,
+        "accounts": accounts if accounts is not None else names,
+        "players": {},
+        "links": {}
+    }
+
+def join_match(game_state, player_id, writer):
+    """Connects a player to their match."""
     game_state["players"][player_id] = writer
-    next_player_id += 1
-    asyncio.create_task(handle_client(reader, writer, player_id, game_state))
+    game_state["links"][player_id] = ClientLink(writer, functools.partial(link_updated, game_state, player_id))
+    store.connected[game_state["slot"], player_id - 1] = True
+
+def leave_match(game_state, player_id):
+    game_state["players"].pop(player_id, None)
+    if not game_state["finished"]:
+        store.connected[game_state["slot"], player_id - 1] = False
+
+def link_updated(game_state, player_id, link):
+    """Copies a player's update interval and rewind limit into the store for the tick to use."""
+    if not game_state["finished"]:
+        store.update_interval[game_state["slot"], player_id - 1] = link.interval
+        store.rewind_ticks[game_state["slot"], player_id - 1] = link.rewind_ticks
+
+def push_input(game_state, player_id, seq, seen_tick, move):
+    if not game_state["finished"]:  # once it is, the slot may belong to another match
+        store.push_input(game_state["slot"], player_id - 1, seq, seen_tick, move)
+
+def start_match(ticket1, ticket2):
+    """Creates a match for two paired tickets and hands each player their slot."""
+    game_state = new_game_state({1: ticket1.name, 2: ticket2.name}, {1: ticket1.account, 2: ticket2.account})
+    print(f"Server: Matched {ticket1.name} ({ticket1.rating:.0f}) with {ticket2.name} ({ticket2.rating:.0f})")
+    events.log("match_start", match=game_state["match_id"], players=[ticket1.name, ticket2.name],
+               ratings=[round(ticket1.rating, 2), round(ticket2.rating, 2)],
+               waited=[round(time.monotonic() - t.enqueued_at, 3) for t in (ticket1, ticket2)])
+    ticket1.matched.set_result((game_state, 1))
+    ticket2.matched.set_result((game_state, 2))
+    matches[game_state["slot"]] = game_state
+
+async def serve_client(reader, writer):
+    """Handles a new client connection: queues the player, then runs their match connection."""
+    addr = writer.get_extra_info('peername')
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout=10)
+    except (asyncio.TimeoutError, ConnectionError):
+        writer.close()
+        return
+    data = line.decode().strip()
+    # '#' is reserved for numbering duplicate connections, so nobody can claim a numbered name's rating
+    account = data.split(":", 1)[1].partition("#")[0] if data.startswith("HELLO:") else ""
+    account = account or f"{addr[0]}:{addr[1]}"
+    name = claim_name(account)
+    try:
+        await queue_and_play(reader, writer, name, account)
+    finally:
+        names_in_use.discard(name)
+
+def claim_name(name):
+    """Reserves a player name, numbering it if someone queued or playing already has it.
+
+    The number only tells the connections apart; ratings stay with the name as given.
+    """
+    claimed, n = name, 1
+    while claimed in names_in_use:
+        n += 1
+        claimed = f"{name}#{n}"
+    if claimed != name:
+        print(f"Server: {name} is already connected, this one plays as {claimed}")
+    names_in_use.add(claimed)
+    return claimed
+
+async def queue_and_play(reader, writer, name, account):
+    """Waits in the matchmaking queue, then runs the player's match connection.
+
+    name is who the player is shown as, account the name their rating is kept under.
+    """
+    addr = writer.get_extra_info('peername')
+    rating = await ratings.get(account)
+    ticket = matchmaker.enqueue(name, rating, account)
+    print(f"Server: {name} queued with rating {rating:.0f} ({len(matchmaker.queue)} waiting)")
+    events.log("connect", name=name, addr=f"{addr[0]}:{addr[1]}", rating=round(rating, 2))
+
+    # Queued clients send nothing, so any read completing means they hung up
+    hung_up = asyncio.ensure_future(reader.read(1))
+    await asyncio.wait({ticket.matched, hung_up}, return_when=asyncio.FIRST_COMPLETED)
+    if not ticket.matched.done():
+        matchmaker.cancel(ticket)
+        ticket.matched.cancel()
+        print(f"Server: {name} left the queue")
+        events.log("disconnect", name=name, reason="left_queue")
+        writer.close()
+        return
+    hung_up.cancel()
+    try:
+        await hung_up  # the reader only allows one waiter, let the cancelled read finish first
+    except asyncio.CancelledError:
+        pass
+
+    game_state, player_id = ticket.matched.result()
+    if game_state["finished"]:
+        await hang_up([writer], b"MATCH_CANCELLED\n")  # too late, the match was already called off
+        return
+    join_match(game_state, player_id, writer)
+    await handle_client(reader, writer, player_id, game_state)
 
 async def main():
-    global game_state, next_player_id
-    game_state = {
-        "paddle1_y": 300,
-        "paddle2_y": 300,
-        "ball_x": 500,
-        "ball_y": 300,
-        "ball_vel_x": 5,
-        "ball_vel_y": 5,
-        "score1": 0,
-        "score2": 0,
-        "players": {}
-    }
-    next_player_id = 1
+    global ratings, matchmaker, events, store, matches, names_in_use
+    events = EventLog(EVENT_LOG_DIR)
+    store = MatchStore()
+    matches = {}  # store slot -> match metadata and connections
+    ratings = RatingStore()
+    matchmaker = Matchmaker()
+    names_in_use = set()  # names of everyone queued or playing
 
     server = await asyncio.start_server(
         serve_client, 'localhost', 5555
@@ -149,12 +665,17 @@ async def main():
     addr = server.sockets[0].getsockname()
     print(f'Server: Serving on {addr}')
 
-    # Start the game logic task
-    asyncio.create_task(game_logic(game_state))
+    # Start the tick loop, matchmaking and rating writer tasks
+    asyncio.create_task(game_logic(store))
+    asyncio.create_task(matchmaker.run())
+    asyncio.create_task(ratings.run())
 
-    async with server:
-        await server.serve_forever()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await ratings.close()
+        events.close()
 
 if __name__ == "__main__":
-    pygame.init()
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,168 @@
+import csv
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pygame
+
+STAGE_COLORS = {
+    "events": (80, 160, 255),
+    "physics": (80, 220, 120),
+    "ai": (255, 200, 60),
+    "network": (200, 80, 255),
+    "draw": (120, 220, 220),
+    "text": (255, 90, 140),
+    "display": (230, 230, 230),
+    "profiler": (120, 120, 120),
+    "wait": (50, 50, 50),
+}
+OTHER_COLOR = (160, 60, 60)
+# Work done on other threads, reported per call rather than stacked into the frame
+BACKGROUND_COLORS = {
+    "predict": (255, 120, 40),
+}
+
+
+class FrameProfiler:
+    """Per-frame stage timings with an on-screen graph and CSV export.
+
+    Stages are exclusive: time spent in a nested stage (say "text" inside
+    "draw") is only counted for the inner one, so a frame's stages add up
+    to its total and whatever is left over is reported as "other".
+    Background work (say the AI's predict() on its worker thread) is
+    recorded from any thread with record() and kept apart from the frame.
+    """
+
+    def __init__(self, font, history=3600, graph_frames=200, budget_ms=1000 / 60):
+        self.font = font
+        self.enabled = False
+        self.samples = deque(maxlen=history)  # (frame, scene, total seconds, {stage: seconds}, background)
+        self.graph_frames = graph_frames
+        self.budget_ms = budget_ms
+        self.frame = 0
+        self.frame_start = time.perf_counter()
+        self.current = {}
+        self.stack = []
+        self.lock = threading.Lock()
+        self.background = {}  # stage -> [seconds, calls] recorded during the current frame
+        self.legend = []
+        self.legend_age = 0
+
+    @contextmanager
+    def stage(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            parent = self.stack[-1]
+            self.current[parent[0]] = self.current.get(parent[0], 0.0) + now - parent[1]
+        entry = [name, now]
+        self.stack.append(entry)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.stack.pop()
+            self.current[name] = self.current.get(name, 0.0) + now - entry[1]
+            if self.stack:
+                self.stack[-1][1] = now
+
+    def record(self, name, seconds):
+        """Adds one call of background work; safe to call from any thread."""
+        with self.lock:
+            entry = self.background.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def end_frame(self, scene):
+        now = time.perf_counter()
+        with self.lock:
+            background, self.background = self.background, {}
+        self.samples.append((self.frame, scene, now - self.frame_start, self.current, background))
+        self.frame += 1
+        self.frame_start = now
+        self.current = {}
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.legend_age = 0
+
+    def dump(self, path=None):
+        """Writes the kept per-frame samples to a CSV file and returns its path."""
+        if path is None:
+            path = time.strftime("profile_%Y%m%d_%H%M%S.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "scene", "total_ms", *STAGE_COLORS, "other_ms",
+                             *(f"{stage}_ms" for stage in BACKGROUND_COLORS),
+                             *(f"{stage}_calls" for stage in BACKGROUND_COLORS)])
+            for frame, scene, total, stages, background in self.samples:
+                row = [stages.get(stage, 0.0) * 1000 for stage in STAGE_COLORS]
+                other = total * 1000 - sum(row)
+                work = [background.get(stage, (0.0, 0)) for stage in BACKGROUND_COLORS]
+                writer.writerow([frame, scene, f"{total * 1000:.3f}", *(f"{ms:.3f}" for ms in row), f"{other:.3f}",
+                                 *(f"{seconds * 1000:.3f}" for seconds, _ in work), *(calls for _, calls in work)])
+        print(f"Profiler: wrote {len(self.samples)} frames to {path}")
+        return path
+
+    def render_legend(self):
+        recent = list(self.samples)[-60:]
+        if not recent:
+            return []
+        n = len(recent)
+        avg_total = sum(s[2] for s in recent) / n * 1000
+        lines = [(f"{avg_total:.2f} ms/frame  {1000 / avg_total if avg_total else 0:.0f} fps  [{recent[-1][1]}]", (255, 255, 255))]
+        for stage, color in STAGE_COLORS.items():
+            avg = sum(s[3].get(stage, 0.0) for s in recent) / n * 1000
+            if avg >= 0.01:
+                lines.append((f"{stage}: {avg:.2f} ms", color))
+        elapsed = sum(s[2] for s in recent)
+        for stage, color in BACKGROUND_COLORS.items():
+            seconds = sum(s[4].get(stage, (0.0, 0))[0] for s in recent)
+            calls = sum(s[4].get(stage, (0.0, 0))[1] for s in recent)
+            if calls:
+                lines.append((f"{stage} (background): {seconds / calls * 1000:.2f} ms x {calls / elapsed:.0f}/s", color))
+        return [self.font.render(text, True, color) for text, color in lines]
+
+    def draw_overlay(self, surface):
+        if not self.enabled:
+            return
+        with self.stage("profiler"):
+            # Re-rendering the legend every frame would dominate the cost of the overlay
+            if self.legend_age <= 0:
+                self.legend = self.render_legend()
+                self.legend_age = 30
+            self.legend_age -= 1
+
+            bar_width, graph_height = 2, 100
+            line_height = self.font.get_linesize()
+            block_height = max(graph_height, len(self.legend) * line_height)
+            x0 = 10
+            y0 = surface.get_height() - block_height - 10
+            graph_top = y0 + block_height - graph_height
+            scale = graph_height / (self.budget_ms * 2)  # full height is two frame budgets
+
+            backdrop = pygame.Surface((self.graph_frames * bar_width + 180, block_height + 10))
+            backdrop.set_alpha(180)
+            backdrop.fill((0, 0, 0))
+            surface.blit(backdrop, (x0 - 5, y0 - 5))
+
+            for i, (_, _, total, stages, _) in enumerate(list(self.samples)[-self.graph_frames:]):
+                x = x0 + i * bar_width
+                bottom = graph_top + graph_height
+                accounted = 0.0
+                for stage, seconds in stages.items():
+                    height = min(seconds * 1000 * scale, bottom - graph_top)
+                    if height >= 1:
+                        pygame.draw.rect(surface, STAGE_COLORS.get(stage, OTHER_COLOR), (x, bottom - height, bar_width, height))
+                        bottom -= height
+                    accounted += seconds
+                height = min((total - accounted) * 1000 * scale, bottom - graph_top)
+                if height >= 1:
+                    pygame.draw.rect(surface, OTHER_COLOR, (x, bottom - height, bar_width, height))
+
+            budget_y = graph_top + graph_height - self.budget_ms * scale
+            pygame.draw.line(surface, (255, 255, 255), (x0, budget_y), (x0 + self.graph_frames * bar_width, budget_y))
+
+            text_x = x0 + self.graph_frames * bar_width + 10
+            for i, text in enumerate(self.legend):
+                surface.blit(text, (text_x, y0 + i * line_height))
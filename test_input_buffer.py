@@ -0,0 +1,69 @@
+# test_input_buffer.py
+#
+# Drives the server's input jitter buffer with clients whose frame rate
+# doesn't match the tick rate. Run with: python -m pytest test_input_buffer.py
+
+import numpy as np
+
+from match_store import MatchStore, JITTER_BUFFER_TICKS
+from pong_server import TICK_RATE
+
+LATENCY = 0.05  # seconds from a client sending an input to the server reading it
+
+
+def play(client_fps, seconds, pause=None):
+    """Runs one client against the server's tick loop.
+
+    Returns the tick each input was played on (None if it never was) and the
+    tick it was sent on. pause is a (start, length) in seconds during which
+    the client sends nothing.
+    """
+    store = MatchStore(capacity=1)
+    slot = store.allocate()
+    sent = []  # (arrival time, seq)
+    send_time = 0.0
+    seq = 0
+    while send_time < seconds:
+        if pause is None or not pause[0] <= send_time < pause[0] + pause[1]:
+            seq += 1
+            sent.append((send_time + LATENCY, seq, send_time))
+        send_time += 1 / client_fps
+
+    played = {}
+    next_input = 0
+    for tick in range(int((seconds + 1) * TICK_RATE)):
+        now = tick / TICK_RATE
+        store.tick[slot] = tick
+        while next_input < len(sent) and sent[next_input][0] <= now:
+            _arrival, seq, _sent_at = sent[next_input]
+            store.push_input(slot, 0, seq, tick, 1)
+            next_input += 1
+        acked = store.ack[slot, 0]
+        store.pop_inputs(np.array([slot]))
+        if store.ack[slot, 0] != acked:
+            played[int(store.ack[slot, 0])] = tick
+    return [(played.get(seq), int(sent_at * TICK_RATE)) for _arrival, seq, sent_at in sent]
+
+
+def delays(results):
+    return [played - sent for played, sent in results if played is not None]
+
+
+def test_slow_client_loses_nothing():
+    results = play(59, 30)
+    assert all(played is not None for played, _sent in results)
+    assert max(delays(results)) <= LATENCY * TICK_RATE + JITTER_BUFFER_TICKS + 2
+
+
+def test_fast_client_latency_stays_bounded():
+    results = play(62.5, 30)
+    assert max(delays(results)) <= LATENCY * TICK_RATE + 2 * JITTER_BUFFER_TICKS + 2
+    # Only the surplus over the tick rate is dropped
+    lost = sum(played is None for played, _sent in results)
+    assert lost <= len(results) * (1 - 60 / 62.5) + 2 * JITTER_BUFFER_TICKS + 2
+
+
+def test_inputs_after_a_pause_are_played():
+    results = play(60, 20, pause=(5, 2))
+    assert all(played is not None for played, _sent in results)
+    assert max(delays(results)) <= LATENCY * TICK_RATE + JITTER_BUFFER_TICKS + 2
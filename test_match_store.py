@@ -0,0 +1,109 @@
+# test_match_store.py
+#
+# Drives MatchStore.step with players whose view of the match lags the
+# server: hits judged where the player saw the ball, and points that wait
+# for the defender to see the ball go out. Run with:
+# python -m pytest test_match_store.py
+
+import numpy as np
+
+from match_store import HEIGHT, MAX_REWIND_TICKS, MatchStore
+
+AWAY = 0  # paddle top that keeps the paddle clear of a ball rolling along the middle
+BALL_Y = HEIGHT // 2
+
+
+def new_match(store, ball_x, vel_x):
+    """A running match with the ball rolling straight along the middle and both paddles out of its way."""
+    slot = store.allocate()
+    store.running[slot] = True
+    store.ball_x[slot] = ball_x
+    store.ball_y[slot] = BALL_Y
+    store.vel_x[slot] = vel_x
+    store.vel_y[slot] = 0
+    store.paddle_y[slot] = AWAY
+    return slot
+
+
+def step(store, slot, lag=(0, 0)):
+    """One tick, with each player looking at the state lag ticks before it."""
+    store.seen_tick[slot] = np.maximum(store.tick[slot] - np.array(lag), 0)
+    scored_slots, scorers = store.step()
+    return dict(zip(scored_slots.tolist(), scorers.tolist())).get(slot)
+
+
+def roll_past_left_paddle(store, slot, until_x=15):
+    """Steps until the ball has passed the left paddle, returning the tick and x where it was first level with it."""
+    level = None
+    while store.ball_x[slot] > until_x:
+        step(store, slot)
+        if level is None and 10 < store.ball_x[slot] < 40:
+            level = int(store.tick[slot]), float(store.ball_x[slot])
+    return level
+
+
+def test_hit_at_the_players_view_bounces_the_ball_back():
+    store = MatchStore(capacity=1, seed=0)
+    slot = new_match(store, 500, -5)
+    level_tick, level_x = roll_past_left_paddle(store, slot)
+
+    # The player moved in front of the ball when they saw it level with their paddle
+    store.paddle_y[slot, 0] = BALL_Y - 50
+    lag = int(store.tick[slot]) - level_tick
+    assert lag + 1 <= MAX_REWIND_TICKS
+    step(store, slot, lag=(lag, 0))
+
+    # Replayed from where the player saw it, moving away since then
+    assert store.vel_x[slot] > 0
+    assert store.ball_x[slot] == level_x + 5 * (lag + 1)
+    assert store.out_tick[slot] == -1
+
+
+def test_hit_further_back_than_the_rewind_limit_misses():
+    store = MatchStore(capacity=1, seed=0)
+    slot = new_match(store, 100, -1)  # slow, so it is still in court that many ticks later
+    level_tick, _level_x = roll_past_left_paddle(store, slot, until_x=5)
+
+    store.paddle_y[slot, 0] = BALL_Y - 50
+    lag = int(store.tick[slot]) - level_tick
+    assert lag + 1 > MAX_REWIND_TICKS
+    step(store, slot, lag=(lag, 0))
+
+    assert store.vel_x[slot] < 0
+    assert store.score[slot].tolist() == [0, 0]
+
+
+def test_point_waits_for_the_defender_to_see_the_ball_go_out():
+    store = MatchStore(capacity=1, seed=0)
+    slot = new_match(store, 100, -5)
+    lag = 10
+    out_tick = scorer = None
+    while scorer is None:
+        scorer = step(store, slot, lag=(lag, 0))
+        if out_tick is None and store.out_tick[slot] >= 0:
+            out_tick = int(store.out_tick[slot])
+        assert store.tick[slot] < 1000
+
+    assert scorer == 2
+    assert store.score[slot].tolist() == [0, 1]
+    # Awarded on the first tick whose input came from a view of the ball out of court
+    assert store.tick[slot] - 1 - lag == out_tick
+    assert store.ball_x[slot] == 500
+
+
+def test_point_waits_no_longer_than_the_rewind_limit():
+    store = MatchStore(capacity=1, seed=0)
+    slot = new_match(store, 100, -5)
+    while store.out_tick[slot] < 0:
+        assert step(store, slot) is None
+    out_tick = int(store.out_tick[slot])
+    assert store.tick[slot] == out_tick
+
+    # The defender's view never gets past the moment the ball was still in
+    while True:
+        scorer = step(store, slot, lag=(int(store.tick[slot]) - out_tick + 1, 0))
+        if scorer is not None:
+            break
+        assert store.score[slot].tolist() == [0, 0]
+    assert scorer == 2
+    assert store.tick[slot] - out_tick == MAX_REWIND_TICKS
@@ -0,0 +1,66 @@
+# test_policy_worker.py
+#
+# Runs the trained AI's background worker against a fake model at decision
+# rates around and above the frame rate. Run with:
+# python -m pytest test_policy_worker.py
+
+import time
+
+from policy_worker import PolicyWorker, STAY
+
+FPS = 60
+UP = 0
+
+
+class FakeModel:
+    """Always moves up, so any STAY the game reads came from the worker."""
+
+    def predict(self, obs, deterministic=True):
+        return UP, None
+
+
+def play(decision_rate, frames=60):
+    """Feeds the worker one observation a frame and counts the frames it moved on."""
+    model = FakeModel()
+    ai = PolicyWorker(lambda: model, decision_rate, FPS).start()
+    moved = 0
+    try:
+        deadline = time.perf_counter() + 1
+        while ai.decisions == 0 and time.perf_counter() < deadline:
+            ai.observe(None, 0)
+            time.sleep(0.001)
+        for frame in range(1, frames + 1):
+            ai.observe(None, frame)
+            moved += ai.action() == UP
+            time.sleep(1 / FPS)
+    finally:
+        ai.stop()
+    return moved, ai.stats()
+
+
+def test_fast_decisions_are_not_stale():
+    for rate in (200, 400, 1000):
+        moved, stats = play(rate)
+        assert stats["stale_frames"] == 0, rate
+        assert moved == 60, rate
+
+
+def test_slow_decisions_are_not_stale():
+    moved, stats = play(12)
+    assert stats["stale_frames"] == 0
+    assert moved == 60
+
+
+def test_decision_far_behind_the_newest_frame_is_stale():
+    ai = PolicyWorker(lambda: None, 1000, FPS)
+    assert ai.max_lag == 3
+    ai.decision = (UP, 10)
+    ai.observe(None, 13)
+    assert ai.action() == UP
+    ai.observe(None, 14)
+    assert ai.action() == STAY
+    assert ai.stats()["stale_frames"] == 1
+
+
+def test_slow_decision_rate_allows_more_lag():
+    assert PolicyWorker(lambda: None, 6, FPS).max_lag == 30
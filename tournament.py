@@ -0,0 +1,294 @@
+# tournament.py
+#
+# Headless tournament between paddle controllers, e.g.
+#   python tournament.py policy:trained_model.zip hard --matches 2000
+#   python tournament.py policy:new_model.zip policy:trained_model.zip --fail-below 0.5
+#
+# Matches follow the same rules as the client's local game loops. Each worker
+# plays a chunk of seeded matches in lockstep so a trained policy makes one
+# batched predict() call per frame instead of one per match.
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+WIDTH, HEIGHT = 1000, 600
+PADDLE_WIDTH, PADDLE_HEIGHT = 10, 100
+BALL_RADIUS = 10
+PADDLE_SPEED = 6  # the client's Paddle.speed, used by the trained AI
+PADDLE_X = {1: 20, 2: WIDTH - PADDLE_WIDTH - 20}
+
+HEURISTIC_SPEEDS = {"easy": 3, "medium": 5, "hard": 7}  # the client's ai_move levels
+
+
+class Match:
+    def __init__(self, seed, points_to_win, max_frames):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.points_to_win = points_to_win
+        self.max_frames = max_frames
+        self.paddle_y = {1: HEIGHT // 2 - PADDLE_HEIGHT // 2, 2: HEIGHT // 2 - PADDLE_HEIGHT // 2}
+        self.score = {1: 0, 2: 0}
+        self.frames = 0
+        self.hits = 0
+        self.rallies = []
+        self.speed_multiplier = 1.0
+        self.time_since_speed_increase = 0
+        self.ball_x, self.ball_y = WIDTH // 2, HEIGHT // 2
+        self.vx = 5 if self.rng.random() < 0.5 else -5
+        self.serve()
+
+    def serve(self):
+        # The client always serves at the same angle; vary it so seeded matches differ
+        self.ball_x, self.ball_y = WIDTH // 2, HEIGHT // 2
+        self.vy = self.rng.uniform(-4, 4)
+
+    @property
+    def done(self):
+        return max(self.score.values()) >= self.points_to_win or self.frames >= self.max_frames
+
+    def view_x(self, side):
+        """Ball x as seen by a controller, which always plays as if it were on the right."""
+        return self.ball_x if side == 2 else WIDTH - self.ball_x
+
+    def move_paddle(self, side, dy):
+        self.paddle_y[side] = max(0, min(self.paddle_y[side] + dy, HEIGHT - PADDLE_HEIGHT))
+
+    def touches(self, side):
+        # Same overlap test as pygame.Rect.colliderect on the client's rects
+        ball_left, ball_top = int(self.ball_x - BALL_RADIUS), int(self.ball_y - BALL_RADIUS)
+        paddle_left, paddle_top = PADDLE_X[side], self.paddle_y[side]
+        return (ball_left < paddle_left + PADDLE_WIDTH and paddle_left < ball_left + BALL_RADIUS * 2
+                and ball_top < paddle_top + PADDLE_HEIGHT and paddle_top < ball_top + BALL_RADIUS * 2)
+
+    def step(self):
+        self.frames += 1
+        self.ball_x += self.vx * self.speed_multiplier
+        self.ball_y += self.vy * self.speed_multiplier
+        if self.ball_y <= 0 or self.ball_y >= HEIGHT - BALL_RADIUS:
+            self.vy *= -1
+        self.time_since_speed_increase += 1
+        if self.time_since_speed_increase >= 300:
+            self.speed_multiplier += 0.1
+            self.time_since_speed_increase = 0
+
+        for side in (1, 2):
+            if self.touches(side):
+                self.vx *= -1
+                self.hits += 1
+
+        scorer = 2 if self.ball_x < 0 else 1 if self.ball_x > WIDTH else None
+        if scorer is not None:
+            self.score[scorer] += 1
+            self.rallies.append(self.hits)
+            self.hits = 0
+            self.vx *= -1
+            self.serve()
+
+    def result(self):
+        if self.score[1] == self.score[2]:
+            winner = 0
+        else:
+            winner = 1 if self.score[1] > self.score[2] else 2
+        return {"seed": self.seed, "winner": winner, "score": [self.score[1], self.score[2]],
+                "frames": self.frames, "rallies": self.rallies}
+
+
+class HeuristicController:
+    """The client's ai_move: chase the ball's height at a fixed speed."""
+
+    def __init__(self, level):
+        self.speed = HEURISTIC_SPEEDS[level]
+
+    def moves(self, matches, side):
+        moves = []
+        for match in matches:
+            center = match.paddle_y[side] + PADDLE_HEIGHT // 2
+            if center < match.ball_y:
+                moves.append(self.speed)
+            elif center > match.ball_y:
+                moves.append(-self.speed)
+            else:
+                moves.append(0)
+        return moves
+
+
+class PolicyController:
+    """The client's trained_ai_move, with one batched prediction for all matches."""
+
+    def __init__(self, path):
+        import torch
+        from stable_baselines3 import PPO
+        torch.set_num_threads(1)  # one process per core already
+        self.model = PPO.load(path)
+
+    def moves(self, matches, side):
+        obs = np.array([[m.view_x(side), m.ball_y, 0, 0] for m in matches], dtype=np.float32)
+        actions, _states = self.model.predict(obs, deterministic=True)
+        return [-PADDLE_SPEED if a == 0 else PADDLE_SPEED if a == 1 else 0 for a in actions]
+
+
+_controllers = {}
+
+def get_controller(spec):
+    """Builds a controller from 'easy', 'medium', 'hard' or 'policy:<path>', once per process."""
+    if spec not in _controllers:
+        if spec.startswith("policy:"):
+            _controllers[spec] = PolicyController(spec.split(":", 1)[1])
+        elif spec in HEURISTIC_SPEEDS:
+            _controllers[spec] = HeuristicController(spec)
+        else:
+            raise ValueError(f"Unknown controller '{spec}'")
+    return _controllers[spec]
+
+_workers_ready = None
+
+def init_worker(specs, workers_ready):
+    """Builds every controller when a worker process starts, so loading a policy is never timed."""
+    global _workers_ready
+    _workers_ready = workers_ready
+    for spec in specs:
+        get_controller(spec)
+
+def wait_for_workers():
+    # Blocks its worker until one of these runs on every worker, so all of them have started
+    _workers_ready.wait(timeout=600)
+
+def play_chunk(spec_a, spec_b, seeds, points_to_win, max_frames):
+    """Plays seeded matches of A against B in lockstep; A takes the left paddle on even seeds."""
+    # Keyed by role, not spec, so a controller can play against itself
+    controllers = {"a": get_controller(spec_a), "b": get_controller(spec_b)}
+    matches = [Match(seed, points_to_win, max_frames) for seed in seeds]
+    left = {m.seed: "a" if m.seed % 2 == 0 else "b" for m in matches}
+    active = matches
+    while active:
+        for side in (1, 2):
+            for role, controller in controllers.items():
+                group = [m for m in active if (left[m.seed] == role) == (side == 1)]
+                if group:
+                    for match, dy in zip(group, controller.moves(group, side)):
+                        match.move_paddle(side, dy)
+        for match in active:
+            match.step()
+        active = [m for m in active if not m.done]
+
+    results = []
+    for match in matches:
+        result = match.result()
+        a_side = 1 if left[match.seed] == "a" else 2
+        result["a_result"] = 0.5 if result["winner"] == 0 else float(result["winner"] == a_side)
+        results.append(result)
+    return results
+
+def wilson_interval(successes, n, z=1.96):
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+def rally_interval(results, resamples=2000, confidence=0.95, seed=0):
+    """Mean rally length with a bootstrap interval that resamples whole matches.
+
+    Rallies within a match are not independent (same controllers, same
+    ball speed-up), so the match is the unit that gets resampled.
+    """
+    sums = np.array([sum(r["rallies"]) for r in results], dtype=float)
+    counts = np.array([len(r["rallies"]) for r in results], dtype=float)
+    if counts.sum() == 0:
+        return 0.0, 0.0, 0.0
+    mean = sums.sum() / counts.sum()
+    picks = np.random.default_rng(seed).integers(0, len(results), (resamples, len(results)))
+    totals = counts[picks].sum(axis=1)
+    means = sums[picks].sum(axis=1)[totals > 0] / totals[totals > 0]
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail])
+    return mean, float(low), float(high)
+
+def summarize(spec_a, spec_b, results, elapsed):
+    score = sum(r["a_result"] for r in results)
+    low, high = wilson_interval(score, len(results))
+    rally_mean, rally_low, rally_high = rally_interval(results)
+    return {
+        "a": spec_a,
+        "b": spec_b,
+        "matches": len(results),
+        "a_wins": sum(r["a_result"] == 1 for r in results),
+        "b_wins": sum(r["a_result"] == 0 for r in results),
+        "draws": sum(r["a_result"] == 0.5 for r in results),
+        "a_win_rate": score / len(results) if results else 0.0,
+        "a_win_rate_ci": [low, high],
+        "rally_length": rally_mean,
+        "rally_length_ci": [rally_low, rally_high],
+        "matches_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+    }
+
+def run_pairing(pool, spec_a, spec_b, args):
+    seeds = list(range(args.seed, args.seed + args.matches))
+    chunks = [seeds[i:i + args.chunk_size] for i in range(0, len(seeds), args.chunk_size)]
+    start = time.perf_counter()
+    futures = [pool.submit(play_chunk, spec_a, spec_b, chunk, args.points, args.max_frames) for chunk in chunks]
+    results = [r for future in futures for r in future.result()]
+    return summarize(spec_a, spec_b, results, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play seeded headless matches between Pong controllers.")
+    parser.add_argument("controllers", nargs="+", help="easy, medium, hard or policy:<path to model zip>")
+    parser.add_argument("--matches", type=int, default=1000, help="matches per pairing")
+    parser.add_argument("--points", type=int, default=5, help="points needed to win a match")
+    parser.add_argument("--max-frames", type=int, default=60 * 60 * 5, help="frames before a match is a draw")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="matches played in lockstep per task")
+    parser.add_argument("--json", help="write the summaries to this file")
+    parser.add_argument("--fail-below", type=float, default=None,
+                        help="exit 1 if the first controller's win rate is significantly below this")
+    args = parser.parse_args()
+
+    if len(args.controllers) < 2:
+        parser.error("need at least two controllers")
+    for spec in args.controllers:
+        if not spec.startswith("policy:") and spec not in HEURISTIC_SPEEDS:
+            parser.error(f"unknown controller '{spec}'")
+
+    workers = args.workers or os.cpu_count() or 1
+    workers_ready = multiprocessing.Barrier(workers)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(args.controllers, workers_ready)) as pool:
+        # Start every worker and load every controller before the first pairing's clock starts
+        for future in [pool.submit(wait_for_workers) for _ in range(workers)]:
+            future.result()
+        for spec_a, spec_b in itertools.combinations(args.controllers, 2):
+            summary = run_pairing(pool, spec_a, spec_b, args)
+            summaries.append(summary)
+            low, high = summary["a_win_rate_ci"]
+            rally_low, rally_high = summary["rally_length_ci"]
+            print(f"{spec_a} vs {spec_b}: {summary['a_wins']}-{summary['b_wins']}-{summary['draws']}, "
+                  f"win rate {summary['a_win_rate']:.3f} [{low:.3f}, {high:.3f}], "
+                  f"rally {summary['rally_length']:.2f} [{rally_low:.2f}, {rally_high:.2f}], "
+                  f"{summary['matches_per_second']:.1f} matches/s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+    if args.fail_below is not None:
+        # Only the first controller's pairings gate the release
+        for summary in summaries:
+            if summary["a"] == args.controllers[0] and summary["a_win_rate_ci"][1] < args.fail_below:
+                print(f"FAIL: {summary['a']} is below {args.fail_below} against {summary['b']}")
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()